@@ -0,0 +1,468 @@
+import os
+import time
+import logging
+import numpy as np
+from database import COUNTRY_PROFILES_CSV
+from athlete_store import get_medal_cube
+from caching import LRUCache
+from observability import count_rows, stage
+
+log = logging.getLogger(__name__)
+
+YEAR_FILTERS = {
+    'all': (1896, 2022),
+    'recent': (2000, 2022),
+    '1990s': (1990, 1999),
+    '1980s': (1980, 1989),
+    '1970s': (1970, 1979),
+    'historical': (1896, 1969)
+}
+
+DEFAULT_YEAR_RANGE = (2000, 2022)
+
+_country_map = None
+
+
+def load_country_map():
+    """NOC -> country name, read from the country profiles CSV once."""
+    global _country_map
+    if _country_map is None:
+        import pandas as pd
+
+        with stage('csv_load'):
+            country_profiles = pd.read_csv(COUNTRY_PROFILES_CSV)
+        _country_map = dict(zip(country_profiles['noc'], country_profiles['country']))
+    return _country_map
+
+
+# Above this many items per axis, 'auto' clustering switches from exact ward
+# linkage to seeded k-means ordering.
+CLUSTER_EXACT_LIMIT = int(os.environ.get('OLYMPIC_CLUSTER_EXACT_LIMIT', '400'))
+
+# Optimal leaf ordering is only attempted for axes up to this size.
+CLUSTER_OLO_LIMIT = int(os.environ.get('OLYMPIC_CLUSTER_OLO_LIMIT', '250'))
+
+# Per-request latency budget for the clustering stage, in milliseconds.
+CLUSTER_BUDGET_MS = float(os.environ.get('OLYMPIC_CLUSTER_BUDGET_MS', '500'))
+
+CLUSTER_METHODS = ('auto', 'ward', 'kmeans')
+
+# (medal_type, year_range, data version) -> country vectors and their
+# pairwise distances, shared by every country_count asked for that window.
+distance_cache = LRUCache(max_bytes=int(os.environ.get('OLYMPIC_DISTANCE_CACHE_MB', '64')) * 1024 * 1024)
+
+
+class CountryDistances:
+    """Float32 country x sport vectors of one window and their distance matrix."""
+
+    def __init__(self, sport_noc_counts):
+        country_totals = sport_noc_counts.sum(axis=0)
+        self.noc_idx = np.flatnonzero(country_totals)
+        self.totals = country_totals[self.noc_idx]
+        self.vectors = np.ascontiguousarray(sport_noc_counts[:, self.noc_idx].T, dtype=np.float32)
+        squared = np.einsum('ij,ij->i', self.vectors, self.vectors)
+        gram = self.vectors @ self.vectors.T
+        distances = squared[:, None] + squared[None, :] - 2 * gram
+        np.maximum(distances, 0, out=distances)
+        np.sqrt(distances, out=distances)
+        np.fill_diagonal(distances, 0)
+        self.distances = distances
+
+    @property
+    def nbytes(self):
+        return self.vectors.nbytes + self.distances.nbytes + self.noc_idx.nbytes + self.totals.nbytes
+
+
+def country_distances_for(cube, medal_type, year_range):
+    year_min, year_max = YEAR_FILTERS.get(year_range, DEFAULT_YEAR_RANGE)
+    key = (medal_type, (year_min, year_max), cube.version)
+
+    def compute():
+        with stage('filtering'):
+            window = cube.counts[cube.year_slice(year_min, year_max)]
+        count_rows('scanned', window.size)
+        with stage('groupby'):
+            return CountryDistances(cube.medal_axis(window.sum(axis=0), medal_type))
+
+    return distance_cache.get_or_compute(key, compute, lambda d: d.nbytes)
+
+
+def _kmeans_order(vectors, n_clusters):
+    """Flat labels (1-based) and an ordering grouped by k-means cluster."""
+    from scipy.cluster.vq import kmeans2
+
+    k = min(n_clusters, len(vectors))
+    centroids, labels = kmeans2(vectors.astype(np.float64), k, minit='++', seed=0)
+    # Clusters with the heaviest centroids first, members by distance to their centroid.
+    cluster_rank = np.argsort(np.argsort(-centroids.sum(axis=1), kind='stable'), kind='stable')
+    spread = np.linalg.norm(vectors - centroids[labels], axis=1)
+    order = np.lexsort((spread, cluster_rank[labels]))
+    return cluster_rank[labels] + 1, order
+
+
+def cluster_axis(vectors, condensed, n_clusters, method, deadline):
+    """Cluster the rows of vectors; returns (labels, order, info).
+
+    Uses ward linkage on the given condensed distances, ordered by its
+    (optionally optimal) dendrogram leaf order, unless the axis is larger
+    than CLUSTER_EXACT_LIMIT or the latency budget is already spent, in
+    which case seeded k-means ordering is used.
+    """
+    from scipy.cluster.hierarchy import linkage, fcluster, leaves_list, optimal_leaf_ordering
+
+    n = len(vectors)
+    if n < 2:
+        return np.ones(n, dtype=int), np.arange(n), {'method': 'trivial', 'optimal_ordering': False}
+
+    over_budget = time.perf_counter() > deadline
+    if method == 'kmeans' or (method == 'auto' and (n > CLUSTER_EXACT_LIMIT or over_budget)):
+        labels, order = _kmeans_order(vectors, n_clusters)
+        return labels, order, {'method': 'kmeans', 'optimal_ordering': False}
+
+    tree = linkage(condensed.astype(np.float64), method='ward')
+    labels = fcluster(tree, t=n_clusters, criterion='maxclust')
+    optimal = n <= CLUSTER_OLO_LIMIT and time.perf_counter() < deadline
+    if optimal:
+        tree = optimal_leaf_ordering(tree, condensed.astype(np.float64))
+    return labels, leaves_list(tree), {'method': 'ward', 'optimal_ordering': bool(optimal)}
+
+
+def build_sport_country_matrix(medal_type, year_range, country_count, cluster_method='auto', budget_ms=None):
+    """Clustered top-N country x sport medal matrix for one parameter set."""
+    from scipy.spatial.distance import pdist, squareform
+
+    start = time.perf_counter()
+    budget_ms = CLUSTER_BUDGET_MS if budget_ms is None else budget_ms
+    deadline = start + budget_ms / 1000
+    if cluster_method not in CLUSTER_METHODS:
+        cluster_method = 'auto'
+
+    year_min, year_max = YEAR_FILTERS.get(year_range, DEFAULT_YEAR_RANGE)
+    cube = get_medal_cube()
+    cached_before = distance_cache.hits
+    prepared = country_distances_for(cube, medal_type, year_range)
+
+    with stage('filtering'):
+        ranked = np.argsort(-prepared.totals, kind='stable')[:country_count]
+        positions = np.sort(ranked)
+        country_sport = prepared.vectors[positions]
+        sport_idx = np.flatnonzero(country_sport.sum(axis=0))
+
+    matrix = country_sport[:, sport_idx]
+    countries = [cube.nocs[prepared.noc_idx[i]] for i in positions]
+    sports = [cube.sports[i] for i in sport_idx]
+
+    with stage('linkage'):
+        country_condensed = squareform(prepared.distances[np.ix_(positions, positions)], checks=False)
+        country_clusters, country_order, country_info = cluster_axis(
+            matrix, country_condensed, 3, cluster_method, deadline)
+
+        sport_condensed = pdist(matrix.T) if len(sports) > 1 else np.empty(0)
+        sport_clusters, sport_order, sport_info = cluster_axis(
+            matrix.T, sport_condensed, 5, cluster_method, deadline)
+
+    ordered_countries = [countries[i] for i in country_order]
+    ordered_sports = [sports[i] for i in sport_order]
+
+    country_map = load_country_map()
+
+    values = matrix[np.ix_(country_order, sport_order)].astype(int).tolist()
+    heatmap_data = []
+    for row, ci in enumerate(country_order.tolist()):
+        country = countries[ci]
+        country_name = country_map.get(country, country)
+        country_cluster = int(country_clusters[ci])
+        for col, si in enumerate(sport_order.tolist()):
+            heatmap_data.append({
+                'country': country,
+                'country_name': country_name,
+                'sport': sports[si],
+                'value': values[row][col],
+                'country_cluster': country_cluster,
+                'sport_cluster': int(sport_clusters[si])
+            })
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    result = {
+        'data': heatmap_data,
+        'countries': ordered_countries,
+        'sports': ordered_sports,
+        'max_value': int(max(d['value'] for d in heatmap_data)) if heatmap_data else 0,
+        'year_range': year_range,
+        'year_min': year_min,
+        'year_max': year_max,
+        'clustering': {
+            'requested': cluster_method,
+            'countries': country_info,
+            'sports': sport_info,
+            'distance_cache_hit': distance_cache.hits > cached_before,
+            'elapsed_ms': round(elapsed_ms, 2),
+            'budget_ms': budget_ms,
+            'within_budget': elapsed_ms <= budget_ms
+        }
+    }
+    log.info("Built sport-country matrix", extra={
+        'medal_type': medal_type,
+        'year_min': year_min,
+        'year_max': year_max,
+        'medal_winners': int(prepared.totals.sum()),
+        'countries': len(countries),
+        'sports': len(sports),
+        'data_points': len(heatmap_data),
+        'max_value': result['max_value'],
+    })
+    return result
+
+
+FLOW_TYPES = ('year-sport-country', 'year-country-sport')
+
+NODE_COLORS = {
+    'year': '#1f77b4',
+    'sport': '#ff7f0e',
+    'country': '#2ca02c'
+}
+
+
+def top_k(totals, k):
+    """Indices of the k largest positive totals, largest first."""
+    candidates = np.flatnonzero(totals > 0)
+    if len(candidates) > k:
+        candidates = candidates[np.argpartition(-totals[candidates], k - 1)[:k]]
+    return candidates[np.lexsort((candidates, -totals[candidates]))]
+
+
+def bucket_matrix(size, keep):
+    """size x (len(keep) + 1) 0/1 matrix mapping kept indices to their own
+    column and everything else to a trailing 'Other' column."""
+    buckets = np.full(size, len(keep))
+    buckets[keep] = np.arange(len(keep))
+    matrix = np.zeros((size, len(keep) + 1), dtype=np.int64)
+    matrix[np.arange(size), buckets] = 1
+    return matrix
+
+
+def build_medal_flow(medal_type, flow_type, node_limit):
+    """Sankey nodes and links of medals flowing year -> sport -> country
+    (or year -> country -> sport), keeping the node_limit largest sports and
+    countries and folding the rest into 'Other' nodes."""
+    cube = get_medal_cube()
+    data = cube.medal_axis(cube.counts, medal_type).astype(np.int64)
+    count_rows('scanned', data.size)
+
+    with stage('filtering'):
+        top_sports = top_k(data.sum(axis=(0, 2)), node_limit)
+        top_nocs = top_k(data.sum(axis=(0, 1)), node_limit)
+
+    # years x sport buckets x country buckets, with 'Other' as the last bucket.
+    with stage('groupby'):
+        flows = np.einsum('ysn,sa,nb->yab', data,
+                          bucket_matrix(len(cube.sports), top_sports),
+                          bucket_matrix(len(cube.nocs), top_nocs), optimize=True)
+
+    country_map = load_country_map()
+    years = cube.years.tolist()
+    sport_names = [cube.sports[i] for i in top_sports] + ['Other sports']
+    country_names = [country_map.get(cube.nocs[i], cube.nocs[i]) for i in top_nocs] + ['Other countries']
+
+    year_sport = flows.sum(axis=2)
+    year_country = flows.sum(axis=1)
+    sport_country = flows.sum(axis=0)
+
+    # Drop the 'Other' buckets when nothing falls into them.
+    keep_sports = np.ones(len(sport_names), dtype=bool)
+    keep_sports[-1] = sport_country[-1].sum() > 0
+    keep_countries = np.ones(len(country_names), dtype=bool)
+    keep_countries[-1] = sport_country[:, -1].sum() > 0
+
+    nodes = [{"name": str(year), "color": NODE_COLORS['year'], "type": "year"} for year in years]
+    if flow_type == 'year-sport-country':
+        layers = [('sport', sport_names, keep_sports), ('country', country_names, keep_countries)]
+    else:
+        layers = [('country', country_names, keep_countries), ('sport', sport_names, keep_sports)]
+
+    node_ids = {}
+    for node_type, names, keep in layers:
+        ids = np.full(len(names), -1)
+        for i in np.flatnonzero(keep):
+            ids[i] = len(nodes)
+            nodes.append({"name": names[i], "color": NODE_COLORS[node_type], "type": node_type})
+        node_ids[node_type] = ids
+    year_ids = np.arange(len(years))
+
+    def links_for(values, source_ids, target_ids):
+        rows, cols = np.nonzero(values)
+        return [
+            {"source": int(source), "target": int(target), "value": int(value)}
+            for source, target, value in zip(source_ids[rows], target_ids[cols], values[rows, cols])
+        ]
+
+    if flow_type == 'year-sport-country':
+        links = (links_for(year_sport, year_ids, node_ids['sport'])
+                 + links_for(sport_country, node_ids['sport'], node_ids['country']))
+    else:
+        links = (links_for(year_country, year_ids, node_ids['country'])
+                 + links_for(sport_country.T, node_ids['country'], node_ids['sport']))
+
+    log.info("Created %d nodes and %d links for %s flow with %s medals", len(nodes), len(links), flow_type, medal_type)
+
+    return {
+        "nodes": nodes,
+        "links": links,
+        "years": years
+    }
+
+
+HOST_MEDAL_TYPES = ('total', 'gold', 'silver', 'bronze')
+
+# Fixed so that the confidence intervals of a dataset never change between requests.
+HOST_ADVANTAGE_SEED = 1896
+HOST_ADVANTAGE_MAX_WINDOW = 4
+HOST_ADVANTAGE_MAX_RESAMPLES = int(os.environ.get('OLYMPIC_HOST_ADVANTAGE_MAX_RESAMPLES', '10000'))
+
+HOST_ADVANTAGE_COLUMNS = [
+    'games_id', 'host_year', 'host_noc', 'host_country', 'medals', 'share', 'baseline_share',
+    'baseline_editions', 'uplift', 'uplift_low', 'uplift_high', 'lift', 'expected_medals',
+    'extra_medals', 'extra_medals_low', 'extra_medals_high',
+]
+
+
+def host_medal_matrix(conn, medal_type):
+    """NOC x edition medal counts of medal_type plus the host of each edition.
+
+    Returns (years, columns, nocs, counts, hosts), with editions in year
+    order, columns mapping each edition's Games_ID to its column, and hosts
+    as (games_id, year, noc, country) rows for the editions with results.
+    """
+    with stage('db_query'):
+        rows = conn.execute(f'''
+            SELECT year, Games_ID, NOC, {medal_type} FROM edition_stats
+            ORDER BY year, gold_rank, NOC
+        ''').fetchall()
+        hosts = conn.execute('''
+            SELECT Games_ID, Year, Host_noc, Host_country FROM games_summary
+            WHERE Season = 'Summer'
+            ORDER BY Year
+        ''').fetchall()
+    count_rows('scanned', len(rows))
+
+    years, games_ids, row_nocs, values = zip(*rows) if rows else ((), (), (), ())
+    years, columns = np.unique(np.array(years, dtype=np.int64), return_inverse=True)
+    edition_columns = dict(zip(games_ids, columns.tolist()))
+
+    hosts = [host for host in hosts if host[2] and host[0] in edition_columns]
+    nocs, noc_rows = np.unique(np.array(list(row_nocs) + [host[2] for host in hosts], dtype=object),
+                               return_inverse=True)
+    counts = np.zeros((len(nocs), len(years)))
+    counts[noc_rows[:len(rows)], columns] = values
+    return years, edition_columns, nocs, counts, hosts
+
+
+def build_host_advantage(conn, medal_type='total', window=2, resamples=2000, confidence=0.95):
+    """Medal uplift of every host edition over its neighbouring editions.
+
+    The baseline of a host is its mean share of the edition's medal_type
+    medals over the window editions before and after its own, leaving out
+    other editions it hosted; editions it won nothing in count as zero.
+    Shares rather than counts keep editions with more events comparable.
+    Each baseline is bootstrapped by resampling its editions with
+    replacement, for all hosts and resamples in one array operation with a
+    fixed seed, and the interval covers the given confidence.
+    """
+    if medal_type not in HOST_MEDAL_TYPES:
+        raise ValueError(f"medal_type must be one of {', '.join(HOST_MEDAL_TYPES)}")
+    if not 1 <= window <= HOST_ADVANTAGE_MAX_WINDOW:
+        raise ValueError(f"window must be between 1 and {HOST_ADVANTAGE_MAX_WINDOW}")
+    if not 1 <= resamples <= HOST_ADVANTAGE_MAX_RESAMPLES:
+        raise ValueError(f"resamples must be between 1 and {HOST_ADVANTAGE_MAX_RESAMPLES}")
+    if not 0 < confidence < 1:
+        raise ValueError("confidence must be between 0 and 1")
+
+    start = time.perf_counter()
+    years, edition_columns, nocs, counts, hosts = host_medal_matrix(conn, medal_type)
+
+    with stage('filtering'):
+        edition_totals = counts.sum(axis=0)
+        shares = counts / np.where(edition_totals > 0, edition_totals, 1)
+        host_rows = np.searchsorted(nocs, np.array([host[2] for host in hosts], dtype=object))
+        host_columns = np.array([edition_columns[host[0]] for host in hosts], dtype=np.intp)
+        hosted = np.zeros(counts.shape, dtype=bool)
+        hosted[host_rows, host_columns] = True
+
+        # hosts x 2*window neighbouring editions, the usable ones packed first.
+        offsets = np.concatenate([np.arange(-window, 0), np.arange(1, window + 1)])
+        neighbours = host_columns[:, None] + offsets
+        usable = (neighbours >= 0) & (neighbours < len(years))
+        neighbours = np.clip(neighbours, 0, max(len(years) - 1, 0))
+        usable &= ~hosted[host_rows[:, None], neighbours]
+        packing = np.argsort(~usable, axis=1, kind='stable')
+        neighbours = np.take_along_axis(neighbours, packing, axis=1)
+        usable = np.take_along_axis(usable, packing, axis=1)
+        baseline_values = shares[host_rows[:, None], neighbours] * usable
+        sizes = usable.sum(axis=1)
+        has_baseline = sizes > 0
+        divisor = np.maximum(sizes, 1)
+
+        host_shares = shares[host_rows, host_columns]
+        baselines = np.where(has_baseline, baseline_values.sum(axis=1) / divisor, np.nan)
+        uplifts = host_shares - baselines
+
+    with stage('bootstrap'):
+        # resamples x hosts x draws: draw j of a host picks one of its sizes
+        # usable editions (as a flat index into baseline_values); draws past
+        # sizes are masked out.
+        rng = np.random.default_rng(HOST_ADVANTAGE_SEED)
+        draws = (rng.random((resamples,) + baseline_values.shape, dtype=np.float32)
+                 * divisor[:, None]).astype(np.intp)
+        draws += (np.arange(len(hosts)) * baseline_values.shape[1])[:, None]
+        sampled = baseline_values.ravel()[draws]
+        boot_baselines = np.einsum('rhd,hd->rh', sampled, usable) / divisor
+        boot_uplifts = np.where(has_baseline, host_shares - boot_baselines, np.nan)
+        tail = (1 - confidence) / 2
+        low, high = np.quantile(boot_uplifts, [tail, 1 - tail], axis=0)
+        mean_low, mean_high = (np.quantile(boot_uplifts[:, has_baseline].mean(axis=1), [tail, 1 - tail])
+                               if has_baseline.any() else (np.nan, np.nan))
+
+    def number(value, digits):
+        return None if np.isnan(value) else round(float(value), digits)
+
+    totals = edition_totals[host_columns]
+    records = []
+    for i, (games_id, year, noc, country) in enumerate(hosts):
+        records.append({
+            'games_id': int(games_id),
+            'host_year': int(year),
+            'host_noc': noc,
+            'host_country': country,
+            'medals': int(counts[host_rows[i], host_columns[i]]),
+            'share': number(host_shares[i], 5),
+            'baseline_share': number(baselines[i], 5),
+            'baseline_editions': years[neighbours[i, :sizes[i]]].tolist(),
+            'uplift': number(uplifts[i], 5),
+            'uplift_low': number(low[i], 5),
+            'uplift_high': number(high[i], 5),
+            'lift': number(host_shares[i] / baselines[i], 3) if baselines[i] > 0 else None,
+            'expected_medals': number(baselines[i] * totals[i], 2),
+            'extra_medals': number(uplifts[i] * totals[i], 2),
+            'extra_medals_low': number(low[i] * totals[i], 2),
+            'extra_medals_high': number(high[i] * totals[i], 2),
+        })
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    log.info("Built host advantage", extra={
+        'medal_type': medal_type,
+        'hosts': len(records),
+        'resamples': resamples,
+        'elapsed_ms': round(elapsed_ms, 2),
+    })
+    return {
+        'hosts': records,
+        'mean_uplift': number(np.nanmean(uplifts) if has_baseline.any() else np.nan, 5),
+        'mean_uplift_low': number(mean_low, 5),
+        'mean_uplift_high': number(mean_high, 5),
+        'medal_type': medal_type,
+        'window': window,
+        'resamples': resamples,
+        'confidence': confidence,
+        'seed': HOST_ADVANTAGE_SEED,
+        'elapsed_ms': round(elapsed_ms, 2),
+    }
@@ -1,137 +1,300 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask, render_template, jsonify, request
-import sqlite3
-import pandas as pd
+import click
 import os
 import json
 import re
+import logging
+import threading
+from urllib.parse import parse_qsl, urlsplit
+from werkzeug.datastructures import MultiDict
+from database import (DB_PATH, HOST_PERFORMANCE_YEARS, SCHEMA_VERSION, append_edition, db_pool, ensure_db,
+                      full_table_scans, read_db_meta)
+from athlete_store import get_medal_cube, ingest_progress, refresh_medal_cube
+from caching import LRUCache, ResponseCache, normalized_args
+from formats import encoded_response, is_columnar, negotiate_format, response_formats, to_columnar, unsupported_format
+from analytics import (CLUSTER_METHODS, FLOW_TYPES, HOST_ADVANTAGE_COLUMNS, build_host_advantage, build_medal_flow,
+                       build_sport_country_matrix, distance_cache, load_country_map)
+from warmup import Warmup
+from workers import ComputeUnavailable, compute_pool
+from profiling import init_app as init_profiling, profile_active
+from observability import configure_logging, count_rows, current_route, init_app as init_metrics, metrics, stage
+
+configure_logging()
+log = logging.getLogger(__name__)
 
 app = Flask(__name__)
+init_metrics(app)
+init_profiling(app)
+
+# 'fast' serves from an existing database straight away and checks it
+# against the CSVs in the background; 'eager' finishes all startup work
+# before the app is importable.
+STARTUP_MODE = os.environ.get('OLYMPIC_STARTUP', 'fast')
+STARTUP_BUDGET_MS = float(os.environ.get('OLYMPIC_STARTUP_BUDGET_MS', '500'))
+
+_db_meta = read_db_meta()
+if STARTUP_MODE == 'fast' and _db_meta and _db_meta['schema_version'] == SCHEMA_VERSION:
+    DATASET_VERSION = _db_meta['dataset_version']
+else:
+    DATASET_VERSION = ensure_db()
 
-if os.path.exists('olympic_data.db'):
+def refresh_database():
+    """Rebuild the database if the CSVs changed since it was built."""
+    global DATASET_VERSION
+    version = ensure_db()
+    if version != DATASET_VERSION:
+        log.info("Database version %s -> %s", DATASET_VERSION, version)
+        DATASET_VERSION = version
+        response_cache.clear()
+
+def reload_dataset():
+    """Switch to data published by another process, e.g. `flask append-edition`.
+
+    A new dataset version drops the response and batch caches; new athlete
+    counts drop the caches built from the medal cube. The compute workers
+    pick up the new counts themselves on their next job.
+    """
+    global DATASET_VERSION
+    meta = read_db_meta()
+    if meta and meta['dataset_version'] != DATASET_VERSION:
+        log.info("Database version %s -> %s", DATASET_VERSION, meta['dataset_version'])
+        DATASET_VERSION = meta['dataset_version']
+        response_cache.clear()
+        shared_results.invalidate()
+        host_advantage_cache.invalidate()
+    if refresh_medal_cube():
+        log.info("Athlete medal counts changed, dropping the medal cube caches")
+        for cache in (matrix_cache, flow_cache, distance_cache):
+            cache.invalidate()
+
+def _db_file_id():
     try:
-        os.remove('olympic_data.db')
-        print("Removed existing database")
-    except:
-        print("Could not remove existing database")
+        stat = os.stat(DB_PATH)
+    except OSError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+_seen_db_file = _db_file_id()
+_reload_lock = threading.Lock()
 
-def init_db():
-    conn = sqlite3.connect('olympic_data.db')
+@app.before_request
+def pick_up_new_data():
+    """Reload once the database file was replaced; costs one stat per request."""
+    global _seen_db_file
+    file_id = _db_file_id()
+    if file_id == _seen_db_file:
+        return
+    with _reload_lock:
+        if file_id != _seen_db_file:
+            reload_dataset()
+            _seen_db_file = file_id
+
+response_cache = ResponseCache(lambda: DATASET_VERSION, variant_func=negotiate_format, bypass_func=profile_active)
+
+def cube_data_version():
+    """Cache version of responses built from the medal cube.
     
+    The athlete counts can change without the database, so the cube's
+    version is part of the key and ETag along with the dataset version.
+    """
     try:
-        country_profiles = pd.read_csv('Olympic_Country_Profiles.csv')
-        games_summary = pd.read_csv('Olympic_Games_Summary.csv')
-        medal_tally = pd.read_csv('Olympic_Medal_Tally_History.csv')
-        
-        summer_games = games_summary[games_summary['edition'].str.contains('Summer', na=False)]
-        
-        games_summary = games_summary.rename(columns={
-            'edition_id': 'Games_ID',
-            'year': 'Year',
-            'city': 'Host_city',
-            'country_noc': 'Host_country'
-        })
-        
-        games_summary['Season'] = games_summary['edition'].apply(
-            lambda x: 'Summer' if 'Summer' in str(x) else 'Winter'
-        )
-        
-        summer_games = games_summary[games_summary['Season'] == 'Summer']
-        summer_games_ids = summer_games['Games_ID'].unique()
-        
-        medal_tally = medal_tally.rename(columns={
-            'edition_id': 'Games_ID',
-            'country_noc': 'NOC',
-            'gold': 'Gold',
-            'silver': 'Silver',
-            'bronze': 'Bronze',
-            'total': 'Total'
-        })
-        
-        summer_medals = medal_tally[medal_tally['Games_ID'].isin(summer_games_ids)]
-        
-        country_profiles = country_profiles.rename(columns={
-            'noc': 'NOC',
-            'country': 'Country'
-        })
-        
-        country_lookup = dict(zip(country_profiles['NOC'], country_profiles['Country']))
-        
-        reverse_lookup = {}
-        for noc, country in country_lookup.items():
-            reverse_lookup[country.upper()] = noc
-        
-        def find_matching_country(host_country):
-            if host_country in country_lookup.values():
-                return host_country
-                
-            host_upper = host_country.upper()
-            if host_upper in reverse_lookup:
-                return reverse_lookup[host_upper]
-                
-            closest = None
-            max_ratio = 0
-            
-            for country in country_lookup.values():
-                ratio = sum(a == b for a, b in zip(host_country.lower(), country.lower())) / max(len(host_country), len(country))
-                if ratio > max_ratio and ratio > 0.8:
-                    max_ratio = ratio
-                    closest = country
-            
-            return closest
-        
-        fixed_count = 0
-        host_country_issues = []
-        
-        for idx, row in summer_games.iterrows():
-            host_country = row['Host_country']
-            
-            if host_country not in country_profiles['Country'].values:
-                match = find_matching_country(host_country)
-                if match:
-                    summer_games.at[idx, 'Host_country'] = match
-                    fixed_count += 1
-                else:
-                    host_country_issues.append(host_country)
-        
-        if fixed_count > 0:
-            print(f"Fixed {fixed_count} host country names to match country_profiles entries")
-        
-        if host_country_issues:
-            print(f"WARNING: Could not find matches for host countries: {', '.join(host_country_issues)}")
-        
-        country_profiles.to_sql('country_profiles', conn, if_exists='replace', index=False)
-        summer_games.to_sql('games_summary', conn, if_exists='replace', index=False)
-        summer_medals.to_sql('medal_tally', conn, if_exists='replace', index=False)
-        
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT COUNT(*) FROM country_profiles")
-        countries_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM games_summary")
-        games_count = cursor.fetchone()[0]
-        
-        cursor.execute("SELECT COUNT(*) FROM medal_tally")
-        medals_count = cursor.fetchone()[0]
-        
-        cursor.execute("""
-            SELECT COUNT(*) FROM games_summary gs
-            JOIN country_profiles cp ON gs.Host_country = cp.Country
-        """)
-        matched_hosts = cursor.fetchone()[0]
-        
-        print(f"Database initialized with: {countries_count} countries, {games_count} games, {medals_count} medal records")
-        print(f"Successfully matched {matched_hosts} out of {games_count} host countries with country profiles")
-        
-        print("Database initialized successfully with Summer Olympics data")
-    except Exception as e:
-        print(f"Error initializing database: {e}")
-        import traceback
-        traceback.print_exc()
+        cube_version = get_medal_cube().version
+    except FileNotFoundError:
+        cube_version = None
+    return DATASET_VERSION, cube_version
+
+HEATMAP_COLUMNS = ['country', 'country_name', 'sport', 'value', 'country_cluster', 'sport_cluster']
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Force a rebuild of the SQLite database from the source CSVs."""
+    global DATASET_VERSION
+    DATASET_VERSION = ensure_db(force=True)
+    response_cache.clear()
+    print(f"Database version {DATASET_VERSION}")
+
+@app.cli.command('append-edition')
+@click.argument('games_csv', type=click.Path(exists=True, dir_okay=False))
+@click.argument('medal_tally_csv', type=click.Path(exists=True, dir_okay=False))
+@click.option('--athletes', 'athlete_events_csv', type=click.Path(exists=True, dir_okay=False),
+              help='Athlete event rows of the edition.')
+def append_edition_command(games_csv, medal_tally_csv, athlete_events_csv):
+    """Add one Summer edition from CSVs holding only its new rows."""
+    try:
+        summary = append_edition(games_csv, medal_tally_csv, athlete_events_csv)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    reload_dataset()
+    print(f"Added {summary['edition']} hosted by {summary['host_country']}: "
+          f"{summary['medal_rows']} medal tally rows, {summary['athlete_rows']} athlete event rows")
+    print(f"Database version {summary['dataset_version']}")
+
+# Example query strings used when exercising the API routes that need arguments.
+QUERY_PLAN_SAMPLES = {
+    '/api/country_medals': ['country=United States', 'country=Nowhere'],
+    '/api/host-performance': ['', 'host_year=1896,2008'],
+    '/api/edition-stats': ['', 'year=2008', 'year_min=1990&year_max=2000', 'noc=USA,CHN'],
+}
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any SQL issued by an /api route does a full table scan."""
+    captured = []
+    db_pool.close_all()
+    db_pool.trace_callback = captured.append
+    client = app.test_client()
+    failures = 0
+    try:
+        for rule in app.url_map.iter_rules():
+            if not rule.rule.startswith('/api/') or rule.arguments:
+                continue
+            for query in QUERY_PLAN_SAMPLES.get(rule.rule, ['']):
+                del captured[:]
+                client.get(f'{rule.rule}?{query}')
+                with db_pool.connection() as conn:
+                    for sql in captured:
+                        if not sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                            continue
+                        scans = full_table_scans(conn, sql)
+                        if scans:
+                            failures += 1
+                            print(f"{rule.rule}?{query}: {'; '.join(scans)}\n    {' '.join(sql.split())}")
     finally:
-        conn.close()
+        db_pool.trace_callback = None
+        db_pool.close_all()
+    if failures:
+        raise SystemExit(f"{failures} endpoint queries do full table scans")
+    print("No endpoint query does a full table scan")
+
+matrix_cache = LRUCache(max_bytes=int(os.environ.get('OLYMPIC_MATRIX_CACHE_MB', '32')) * 1024 * 1024)
+
+def cached_sport_country_matrix(medal_type='total', year_range='recent', country_count=25, cluster_method='auto'):
+    """Memoized build_sport_country_matrix keyed by its parameters and the data version."""
+    medal_type = medal_type.lower()
+    key = (medal_type, year_range, int(country_count), cluster_method, get_medal_cube().version)
+    sizeof = lambda result: len(json.dumps(result))
+    return matrix_cache.get_or_compute(
+        key,
+        lambda: compute_pool.run(
+            build_sport_country_matrix, medal_type, year_range, int(country_count), cluster_method,
+            on_late=lambda result: matrix_cache.put(key, result, sizeof(result)), inline=profile_active()),
+        sizeof,
+        label='sport_country_matrix'
+    )
+
+flow_cache = LRUCache(max_bytes=int(os.environ.get('OLYMPIC_FLOW_CACHE_MB', '16')) * 1024 * 1024)
+
+def cached_medal_flow(medal_type='total', flow_type='year-sport-country', node_limit=15):
+    """Memoized build_medal_flow keyed by its parameters and the data version."""
+    medal_type = medal_type.lower()
+    key = (medal_type, flow_type, max(int(node_limit), 1), get_medal_cube().version)
+    sizeof = lambda result: len(json.dumps(result))
+    return flow_cache.get_or_compute(
+        key,
+        lambda: compute_pool.run(
+            build_medal_flow, medal_type, flow_type, max(int(node_limit), 1),
+            on_late=lambda result: flow_cache.put(key, result, sizeof(result)), inline=profile_active()),
+        sizeof,
+        label='medal_flow'
+    )
+
+host_advantage_cache = LRUCache(max_bytes=int(os.environ.get('OLYMPIC_HOST_ADVANTAGE_CACHE_MB', '4')) * 1024 * 1024)
+
+def cached_host_advantage(medal_type='total', window=2, resamples=2000, confidence=0.95):
+    """Memoized build_host_advantage keyed by its parameters and the dataset version.
+    
+    Runs on the request thread: it reads the database and takes tens of
+    milliseconds even at the maximum number of resamples.
+    """
+    key = (medal_type, window, resamples, confidence, DATASET_VERSION)
+    
+    def compute():
+        with db_pool.connection() as conn:
+            return build_host_advantage(conn, medal_type, window, resamples, confidence)
+    
+    return host_advantage_cache.get_or_compute(
+        key, compute, lambda result: len(json.dumps(result)), label='host_advantage')
+
+def compute_unavailable(error):
+    """503 for analytics requests the compute pool refused or did not finish in time."""
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def import_clustering():
+    import scipy.cluster.hierarchy
+    import scipy.spatial.distance
+
+def prewarm_bootstrap():
+    client = app.test_client()
+    for page in BOOTSTRAP_PAGES:
+        client.get(f'/api/bootstrap/{page}?format=columnar')
 
-init_db()
+warmup = Warmup()
+warmup.add('database', refresh_database)
+warmup.add('medal_cube', get_medal_cube)
+warmup.add('clustering_imports', import_clustering, required=False)
+if os.environ.get('OLYMPIC_PREWARM', '1') == '1':
+    warmup.add('sport_country_matrix', cached_sport_country_matrix, required=False)
+    warmup.add('bootstrap_pages', prewarm_bootstrap, required=False)
+
+def cache_metrics():
+    caches = {
+        'response': response_cache,
+        'matrix': matrix_cache,
+        'flow': flow_cache,
+        'distance': distance_cache,
+        'shared_results': shared_results,
+        'host_advantage': host_advantage_cache,
+    }
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    for field, kind in (('hits', 'counter'), ('misses', 'counter'), ('coalesced', 'counter'),
+                        ('entries', 'gauge'), ('bytes', 'gauge')):
+        yield (f'olympic_cache_{field}' + ('_total' if kind == 'counter' else ''), kind,
+               f'Cache {field} by cache.', [({'cache': name}, s[field]) for name, s in stats.items()])
+    yield ('olympic_coalesced_requests_total', 'counter',
+           'Requests that waited for an identical in-flight request instead of running the view.',
+           [({'endpoint': endpoint}, count)
+            for endpoint, count in response_cache.flight.stats()['coalesced_by'].items()])
+    pool = db_pool.stats()
+    yield ('olympic_db_connections_opened_total', 'counter', 'SQLite connections opened by the pool.',
+           [({}, pool['opened'])])
+    yield ('olympic_db_checkouts_total', 'counter', 'Connections checked out of the pool.', [({}, pool['checkouts'])])
+    yield ('olympic_db_connections_idle', 'gauge', 'Idle pooled connections.', [({}, pool['idle'])])
+    compute = compute_pool.stats()
+    yield ('olympic_compute_workers', 'gauge', 'Analytics worker processes.', [({}, compute['workers'])])
+    yield ('olympic_compute_pending', 'gauge', 'Analytics jobs queued or running.', [({}, compute['pending'])])
+    yield ('olympic_compute_queue_depth', 'gauge', 'Analytics jobs waiting for a free worker.',
+           [({}, compute['queue_depth'])])
+    for field in ('completed', 'rejected', 'timeouts'):
+        yield (f'olympic_compute_{field}_total', 'counter', f'Analytics jobs {field.replace("_", " ")}.',
+               [({}, compute[field])])
+    yield ('olympic_ready', 'gauge', '1 once the required startup tasks finished.', [({}, int(warmup.ready()))])
+
+metrics.add_collector(cache_metrics)
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({
+        'status': 'ok',
+        'dataset_version': DATASET_VERSION,
+        'import_ms': IMPORT_MS,
+        'startup_budget_ms': STARTUP_BUDGET_MS,
+        'compute': compute_pool.stats(),
+    })
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: 200 once the required startup tasks finished, 503 until then."""
+    status = warmup.status()
+    status['dataset_version'] = DATASET_VERSION
+    status['ingest'] = ingest_progress()
+    return jsonify(status), 200 if status['ready'] else 503
 
 @app.route('/')
 def index():
@@ -153,66 +316,213 @@ def sport_dominance():
 def advanced_visualizations():
     return render_template('advanced_visualizations.html')
 
-@app.route('/api/countries')
-def get_countries():
-    conn = sqlite3.connect('olympic_data.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+def fetch_rows(cursor):
+    """fetchall() timed as the db_query stage and counted as returned rows."""
+    with stage('db_query'):
+        rows = cursor.fetchall()
+    count_rows('returned', len(rows))
+    return rows
+
+def fetch_countries(conn, args):
+    cursor = conn.execute('''
         SELECT DISTINCT NOC as country_noc, Country as country
         FROM country_profiles
         ORDER BY Country
     ''')
-    
-    countries = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    
-    return jsonify(countries)
+    return ['country_noc', 'country'], fetch_rows(cursor)
 
-@app.route('/api/games')
-def get_games():
-    conn = sqlite3.connect('olympic_data.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+def fetch_games(conn, args):
+    cursor = conn.execute('''
         SELECT Games_ID, Year as year, Host_city as host_city, Host_country as host_country, Season as season
         FROM games_summary
         ORDER BY Year
     ''')
+    return ['Games_ID', 'year', 'host_city', 'host_country', 'season'], fetch_rows(cursor)
+
+def medal_tally_query(args):
+    """SQL and parameters for the medal tally filters and keyset page in args.
     
-    games = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    Raises ValueError on malformed parameters.
+    """
+    conditions, params = [], []
     
-    return jsonify(games)
-
-@app.route('/api/medal-tally')
-def get_medal_tally():
-    conn = sqlite3.connect('olympic_data.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    if args.get('year_min'):
+        conditions.append('gs.Year >= ?')
+        params.append(int(args['year_min']))
+    if args.get('year_max'):
+        conditions.append('gs.Year <= ?')
+        params.append(int(args['year_max']))
+    
+    nocs = [n.strip().upper() for value in args.getlist('noc') for n in value.split(',') if n.strip()]
+    if nocs:
+        conditions.append(f"mt.NOC IN ({','.join('?' * len(nocs))})")
+        params.extend(nocs)
+    
+    if args.get('after'):
+        after_year, after_total, after_noc = args['after'].split(',')
+        conditions.append('(gs.Year > ? OR (gs.Year = ? AND (mt.Total < ? OR (mt.Total = ? AND mt.NOC > ?))))')
+        params.extend([int(after_year), int(after_year), int(after_total), int(after_total), after_noc])
     
-    cursor.execute('''
+    limit = int(args['limit']) if args.get('limit') else None
+    if limit is not None and limit <= 0:
+        raise ValueError("limit must be positive")
+    
+    sql = '''
         SELECT mt.NOC as noc, mt.Games_ID as games_id, gs.Year as year,
                mt.Gold as gold, mt.Silver as silver, mt.Bronze as bronze,
                mt.Total as total, gs.Host_country as host_country
         FROM medal_tally mt
         JOIN games_summary gs ON mt.Games_ID = gs.Games_ID
-        ORDER BY gs.Year, mt.Total DESC
-    ''')
+    '''
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY gs.Year, mt.Total DESC, mt.NOC'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, params
+
+def fetch_medal_tally(conn, args):
+    sql, params = medal_tally_query(args)
+    cursor = conn.execute(sql, params)
+    return [d[0] for d in cursor.description], fetch_rows(cursor)
+
+def edition_stats_query(args):
+    """SQL and parameters for the edition stats filters in args.
+    
+    Raises ValueError on malformed parameters.
+    """
+    conditions, params = [], []
+    
+    years = [int(y) for value in args.getlist('year') for y in value.split(',') if y.strip()]
+    if years:
+        conditions.append(f"year IN ({','.join('?' * len(years))})")
+        params.extend(years)
+    if args.get('year_min'):
+        conditions.append('year >= ?')
+        params.append(int(args['year_min']))
+    if args.get('year_max'):
+        conditions.append('year <= ?')
+        params.append(int(args['year_max']))
+    
+    nocs = [n.strip().upper() for value in args.getlist('noc') for n in value.split(',') if n.strip()]
+    if nocs:
+        conditions.append(f"NOC IN ({','.join('?' * len(nocs))})")
+        params.extend(nocs)
+    
+    sql = '''
+        SELECT NOC as noc, Games_ID as games_id, year, gold, silver, bronze, total,
+               gold_rank, total_rank, cumulative_gold, cumulative_silver,
+               cumulative_bronze, cumulative_total, gold_share, medal_share
+        FROM edition_stats
+    '''
+    if conditions:
+        sql += ' WHERE ' + ' AND '.join(conditions)
+    sql += ' ORDER BY year, gold_rank, NOC'
+    return sql, params
+
+def fetch_edition_stats(conn, args):
+    sql, params = edition_stats_query(args)
+    cursor = conn.execute(sql, params)
+    return [d[0] for d in cursor.description], fetch_rows(cursor)
+
+@app.route('/api/countries')
+@response_cache.cached()
+def get_countries():
+    with db_pool.connection() as conn:
+        columns, countries = fetch_countries(conn, request.args)
+    
+    return rows_response(countries, columns)
+
+@app.route('/api/games')
+@response_cache.cached()
+def get_games():
+    with db_pool.connection() as conn:
+        columns, games = fetch_games(conn, request.args)
     
-    medals = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    return rows_response(games, columns)
+
+@app.route('/api/medal-tally')
+@response_cache.cached()
+def get_medal_tally():
+    """Medal tally rows ordered by (year, total desc, noc), streamed as they are read.
     
-    return jsonify(medals)
+    Optional filters: year_min, year_max, noc (comma-separated or repeated).
+    Pagination is keyset based: limit caps the page size and after=year,total,noc
+    (the key of the last row already seen) starts the page after that row.
+    format=ndjson emits one JSON object per line instead of a JSON array;
+    format=columnar / msgpack (or the matching Accept type) return one
+    columnar table instead of a stream.
+    """
+    fmt = negotiate_format()
+    formats = response_formats('ndjson')
+    if fmt not in formats:
+        return unsupported_format(formats)
+    
+    try:
+        sql, params = medal_tally_query(request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid year_min, year_max, after or limit parameter"}), 400
+    
+    if is_columnar(fmt):
+        with db_pool.connection() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [d[0] for d in cursor.description]
+            return encoded_response(to_columnar(fetch_rows(cursor), columns), fmt)
+    
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+    return app.response_class(stream_query_rows(sql, params, fmt, route=current_route()), mimetype=mimetype)
+
+def rows_response(rows, columns):
+    """Serialize query rows as a list of objects or, if negotiated, a columnar table."""
+    fmt = negotiate_format()
+    if is_columnar(fmt):
+        return encoded_response(to_columnar(rows, columns), fmt)
+    with stage('serialize'):
+        return jsonify([dict(zip(columns, row)) for row in rows])
+
+def stream_query_rows(sql, params, fmt='json', batch_size=500, route=None):
+    """Yield the rows of sql encoded as a JSON array or NDJSON, batch by batch.
+
+    The body is produced after the view returns, so stage timings are
+    recorded against the route passed in.
+    """
+    with db_pool.connection() as conn:
+        with stage('db_query', route):
+            cursor = conn.execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        encode = json.JSONEncoder(sort_keys=True, separators=(',', ':')).encode
+        first = True
+        
+        if fmt == 'json':
+            yield b'['
+        
+        while True:
+            with stage('db_query', route):
+                rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            count_rows('returned', len(rows), route)
+            
+            with stage('serialize', route):
+                encoded = [encode(dict(zip(columns, row))) for row in rows]
+            if fmt == 'ndjson':
+                yield ('\n'.join(encoded) + '\n').encode()
+            else:
+                yield (('' if first else ',') + ','.join(encoded)).encode()
+            first = False
+        
+        if fmt == 'json':
+            yield b']'
 
 @app.route('/api/sports')
 def get_sports():
     try:
         import pandas as pd
         
-        event_data = pd.read_csv('Olympic_Event_Results.csv', usecols=['sport', 'edition'])
+        with stage('csv_load'):
+            event_data = pd.read_csv('Olympic_Event_Results.csv', usecols=['sport', 'edition'])
+        count_rows('scanned', len(event_data))
         
         summer_event_data = event_data[event_data['edition'].str.contains('Summer', na=False)]
         
@@ -221,12 +531,10 @@ def get_sports():
         sports_to_exclude = ['Art Competitions'] 
         sports = [sport for sport in sports if sport not in sports_to_exclude]
         
-        print(f"Found {len(sports)} Olympic summer sports from the dataset")
+        log.info("Found %d Olympic summer sports from the dataset", len(sports))
         return jsonify(sports)
-    except Exception as e:
-        print(f"Error getting sports: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error getting sports")
         
         sports = [
             "Athletics", "Swimming", "Gymnastics", "Cycling", "Rowing", 
@@ -234,10 +542,11 @@ def get_sports():
             "Weightlifting", "Wrestling", "Judo", "Taekwondo", "Archery",
             "Shooting", "Sailing", "Badminton", "Table Tennis", "Fencing"
         ]
-        print("Using fallback sports list")
+        log.warning("Using fallback sports list")
         return jsonify(sports)
 
 @app.route('/api/sport_medals')
+@response_cache.cached(version_func=cube_data_version)
 def get_sport_medals():
     sport = request.args.get('sport')
     
@@ -245,494 +554,416 @@ def get_sport_medals():
         return jsonify({"error": "Sport parameter is required"}), 400
     
     try:
-        import pandas as pd
+        cube = get_medal_cube()
+        sport_idx = cube.sport_index.get(sport)
         
-        try:
-            athlete_events = pd.read_csv('Olympic_Athlete_Event_Details.csv', 
-                                       usecols=['athlete_id', 'edition', 'year', 'season', 'noc', 'sport', 'medal'])
-        except ValueError as e:
-            print(f"Error with lowercase columns, trying with uppercase: {e}")
-            try:
-                athlete_events = pd.read_csv('Olympic_Athlete_Event_Details.csv', 
-                                           usecols=['Athlete_ID', 'Edition', 'Year', 'Season', 'NOC', 'Sport', 'Medal'])
-                
-                athlete_events.columns = athlete_events.columns.str.lower()
-            except ValueError as e2:
-                print(f"Error with uppercase columns: {e2}")
-                athlete_events = pd.read_csv('Olympic_Athlete_Event_Details.csv')
-                
-                print(f"Available columns in CSV: {athlete_events.columns.tolist()}")
-                
-                athlete_events.columns = athlete_events.columns.str.lower()
-        
-        print(f"Loaded {len(athlete_events)} athlete event records")
-        
-        summer_data = athlete_events[athlete_events['edition'].str.contains('Summer', na=False)]
-        sport_data = summer_data[summer_data['sport'] == sport]
-        
-        if len(sport_data) == 0:
-            print(f"No medal data found for {sport} in Olympic_Athlete_Event_Details.csv")
+        if sport_idx is None:
+            log.info("No medal data found for %s in Olympic_Athlete_Event_Details.csv", sport)
             return jsonify([])
         
-        sport_data['year'] = sport_data['edition'].str.extract(r'(\d{4})').astype(int)
-        
-        medal_data = sport_data[sport_data['medal'].notna()]
-        
-        country_profiles = pd.read_csv('Olympic_Country_Profiles.csv')
+        timeline = cube.counts[:, sport_idx, :, :]
+        count_rows('scanned', timeline.shape[0] * timeline.shape[1])
+        with stage('filtering'):
+            year_idx, noc_idx = timeline.sum(axis=2).nonzero()
         
-        country_map = dict(zip(country_profiles['noc'], country_profiles['country']))
+        if len(year_idx) == 0:
+            log.info("No medal data found for %s in Olympic_Athlete_Event_Details.csv", sport)
+            return jsonify([])
         
-        print(f"Processing {len(medal_data)} medal records for {sport}")
+        country_map = load_country_map()
         
-        medals_by_country = medal_data.groupby(['year', 'country_noc', 'medal']).size().reset_index(name='count')
+        gold, silver, bronze = timeline[year_idx, noc_idx].T.tolist()
+        years = cube.years[year_idx].tolist()
         
         results = []
         
-        for (year, noc), group in medals_by_country.groupby(['year', 'country_noc']):
-            gold = 0
-            silver = 0
-            bronze = 0
-            
-            for _, row in group.iterrows():
-                medal_type = row['medal'].lower() if isinstance(row['medal'], str) else ''
-                count = row['count']
-                
-                if 'gold' in medal_type:
-                    gold += count
-                elif 'silver' in medal_type:
-                    silver += count
-                elif 'bronze' in medal_type:
-                    bronze += count
-            
+        for i, noc in enumerate(noc_idx.tolist()):
+            noc = cube.nocs[noc]
             country = country_map.get(noc, noc)
             
             if country == "People's Republic of China":
                 country = "China"
             
             results.append({
-                'year': int(year),
+                'year': years[i],
                 'country': country,
-                'gold': int(gold),
-                'silver': int(silver),
-                'bronze': int(bronze)
+                'gold': gold[i],
+                'silver': silver[i],
+                'bronze': bronze[i]
             })
         
-        print(f"Returning {len(results)} medal records for {sport}")
-        return jsonify(results)
+        log.info("Returning %d medal records for %s", len(results), sport)
+        count_rows('returned', len(results))
+        with stage('serialize'):
+            return jsonify(results)
         
-    except Exception as e:
-        print(f"Error processing sport medals: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Error processing sport medals")
         
-        return jsonify([])
+        # Not a 200, so the response cache does not keep the failure.
+        return jsonify([]), 500
 
 @app.route('/api/olympic_years')
+@response_cache.cached()
 def get_olympic_years():
-    conn = sqlite3.connect('olympic_data.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT DISTINCT Year 
-        FROM games_summary 
-        WHERE Season = 'Summer' 
-        ORDER BY Year
-    ''')
-    
-    years = [row['Year'] for row in cursor.fetchall()]
-    conn.close()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT DISTINCT Year 
+            FROM games_summary 
+            WHERE Season = 'Summer' 
+            ORDER BY Year
+        ''')
+        
+        years = [row['Year'] for row in cursor.fetchall()]
     
     return jsonify(years)
 
 @app.route('/api/host_cities')
+@response_cache.cached()
 def get_host_cities():
-    conn = sqlite3.connect('olympic_data.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT DISTINCT Year as year, Host_city as city, Host_country as country
-        FROM games_summary
-        WHERE Season = 'Summer'
-        ORDER BY Year
-    ''')
-    
-    hosts = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT DISTINCT Year as year, Host_city as city, Host_country as country
+            FROM games_summary
+            WHERE Season = 'Summer'
+            ORDER BY Year
+        ''')
+        
+        hosts = [dict(row) for row in cursor.fetchall()]
     
     return jsonify(hosts)
 
 @app.route('/api/country_medals')
+@response_cache.cached()
 def get_country_medals():
     country = request.args.get('country')
     
     if not country:
         return jsonify({"error": "Country parameter is required"}), 400
     
-    conn = sqlite3.connect('olympic_data.db')
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT NOC FROM country_profiles 
-        WHERE Country = ?
-    ''', (country,))
-    
-    noc_row = cursor.fetchone()
-    if not noc_row:
-        return jsonify({"error": f"Country '{country}' not found"}), 404
-    
-    noc = noc_row['NOC']
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT NOC FROM country_profiles 
+            WHERE Country = ?
+        ''', (country,))
+        
+        noc_row = cursor.fetchone()
+        if not noc_row:
+            return jsonify({"error": f"Country '{country}' not found"}), 404
+        
+        noc = noc_row['NOC']
+        
+        cursor.execute('''
+            SELECT gs.Year as year, mt.Gold as gold, mt.Silver as silver, mt.Bronze as bronze
+            FROM medal_tally mt
+            JOIN games_summary gs ON mt.Games_ID = gs.Games_ID
+            WHERE mt.NOC = ? AND gs.Season = 'Summer'
+            ORDER BY gs.Year
+        ''', (noc,))
+        
+        results = []
+        for row in cursor.fetchall():
+            results.append({
+                'year': row['year'],
+                'gold': row['gold'],
+                'silver': row['silver'],
+                'bronze': row['bronze'],
+                'total': row['gold'] + row['silver'] + row['bronze']
+            })
     
-    cursor.execute('''
-        SELECT gs.Year as year, mt.Gold as gold, mt.Silver as silver, mt.Bronze as bronze
-        FROM medal_tally mt
-        JOIN games_summary gs ON mt.Games_ID = gs.Games_ID
-        WHERE mt.NOC = ? AND gs.Season = 'Summer'
-        ORDER BY gs.Year
-    ''', (noc,))
-    
-    results = []
-    for row in cursor.fetchall():
-        results.append({
-            'year': row['year'],
-            'gold': row['gold'],
-            'silver': row['silver'],
-            'bronze': row['bronze'],
-            'total': row['gold'] + row['silver'] + row['bronze']
-        })
-    
-    conn.close()
     return jsonify(results)
 
 @app.route('/api/host-performance')
+@response_cache.cached()
 def get_host_performance():
     try:
-        conn = sqlite3.connect('olympic_data.db')
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
+        with db_pool.connection() as conn:
+            payloads = fetch_host_performance(conn, request.args)
         
-        cursor.execute('''
-            SELECT Year as host_year, Host_country as host_country
-            FROM games_summary
-            ORDER BY Year
-        ''')
+        log.info("Returning data for %d hosts with all Olympic years", len(payloads))
         
-        hosts = [dict(row) for row in cursor.fetchall()]
-        print(f"Found {len(hosts)} host entries from games_summary")
+        fmt = negotiate_format()
+        if is_columnar(fmt):
+            return encoded_response(host_performance_columnar(payloads), fmt)
         
-        for host in hosts:
-            cursor.execute('''
-                SELECT NOC FROM country_profiles
-                WHERE Country = ?
-            ''', (host['host_country'],))
-            
-            noc_result = cursor.fetchone()
-            if noc_result:
-                host['host_noc'] = noc_result['NOC']
-            else:
-                if host['host_country'] == 'GRE':
-                    host['host_noc'] = 'GRE'
-                elif host['host_country'] == 'FRA':
-                    host['host_noc'] = 'FRA'
-                elif host['host_country'] == 'USA':
-                    host['host_noc'] = 'USA'
-                elif host['host_country'] == 'GBR':
-                    host['host_noc'] = 'GBR'
-                elif host['host_country'] == 'SWE':
-                    host['host_noc'] = 'SWE'
-                else:
-                    host['host_noc'] = host['host_country'][:3].upper()
-                print(f"Using fallback NOC {host['host_noc']} for {host['host_country']}")
-        
-        host_performance = []
-        
-        for host in hosts:
-            host['host_year'] = str(host['host_year'])
-            
-            cursor.execute('''
-                SELECT gs.Year as year, mt.Total as total,
-                       mt.Gold as gold, mt.Silver as silver, mt.Bronze as bronze
-                FROM medal_tally mt
-                JOIN games_summary gs ON mt.Games_ID = gs.Games_ID
-                WHERE mt.NOC = ?
-                ORDER BY gs.Year
-            ''', (host['host_noc'],))
-            
-            performance = [dict(row) for row in cursor.fetchall()]
-            
-            performance_map = {}
-            for p in performance:
-                performance_map[str(p['year'])] = p
-            
-            all_olympic_years = []
-            for year in range(1896, 2036, 4):
-                if str(year) in performance_map:
-                    all_olympic_years.append(performance_map[str(year)])
-                else:
-                    all_olympic_years.append({
-                        "year": str(year),
-                        "total": None,
-                        "gold": None,
-                        "silver": None,
-                        "bronze": None
-                    })
-            
-            host_performance.append({
-                "host_country": host['host_country'],
-                "host_noc": host['host_noc'],
-                "host_year": host['host_year'],
-                "performance": all_olympic_years
-            })
-        
-        conn.close()
+        return app.response_class('[' + ','.join(payloads) + ']', mimetype='application/json')
+    except ValueError:
+        return jsonify({"error": "host_year must be a comma-separated list of years"}), 400
+    except Exception:
+        log.exception("Error in get_host_performance")
         
-        print(f"Returning data for {len(host_performance)} hosts with all Olympic years")
-        return jsonify(host_performance)
-    except Exception as e:
-        print(f"ERROR in get_host_performance: {e}")
-        import traceback
-        traceback.print_exc()
-        
-        return jsonify([])
+        # Not a 200, so the response cache does not keep the failure.
+        return jsonify([]), 500
+
+def fetch_host_performance(conn, args):
+    """Stored JSON payloads of all hosts, or of the hosts in ?host_year=."""
+    host_years = args.get('host_year')
+    
+    if host_years:
+        years = [int(y) for y in host_years.split(',') if y.strip()]
+        cursor = conn.execute(f'''
+            SELECT payload FROM host_performance
+            WHERE host_year IN ({','.join('?' * len(years))})
+            ORDER BY host_year
+        ''', years)
+    else:
+        cursor = conn.execute('''
+            SELECT payload FROM host_performance
+            ORDER BY host_year
+        ''')
+    
+    return [row[0] for row in fetch_rows(cursor)]
+
+@app.route('/api/edition-stats')
+@response_cache.cached()
+def get_edition_stats():
+    """Precomputed per-edition ranks, running totals and medal shares.
+    
+    One row per NOC and edition, ordered by (year, gold_rank, noc): gold_rank
+    ranks by gold, then silver and bronze, total_rank by total medals; the
+    cumulative_* columns count the NOC's medals up to and including that
+    edition; gold_share and medal_share are fractions of the edition's
+    golds and medals. Optional filters: year (comma-separated or repeated),
+    year_min, year_max, noc (comma-separated or repeated).
+    """
+    try:
+        with db_pool.connection() as conn:
+            columns, rows = fetch_edition_stats(conn, request.args)
+    except ValueError:
+        return jsonify({"error": "year, year_min and year_max must be integers"}), 400
+    
+    return rows_response(rows, columns)
+
+def host_performance_columnar(payloads):
+    """Columnar host table plus a long table of the non-empty performance years.
+    
+    Clients rebuild the null-padded series from the 'years' grid.
+    """
+    hosts = [json.loads(payload) for payload in payloads]
+    performance = [
+        (host_index, p['year'], p['gold'], p['silver'], p['bronze'], p['total'])
+        for host_index, host in enumerate(hosts)
+        for p in host['performance']
+        if p['total'] is not None
+    ]
+    table = to_columnar(hosts, ['host_country', 'host_noc', 'host_year'])
+    table['performance'] = to_columnar(performance, ['host', 'year', 'gold', 'silver', 'bronze', 'total'])
+    table['years'] = list(HOST_PERFORMANCE_YEARS)
+    return table
+
+# Sub-requests /api/batch and /api/bootstrap/<page> can serve, mapped to
+# functions returning (columns, rows) or, for host performance, JSON payloads.
+BATCH_RESOURCES = {
+    '/api/countries': fetch_countries,
+    '/api/games': fetch_games,
+    '/api/medal-tally': fetch_medal_tally,
+    '/api/host-performance': fetch_host_performance,
+    '/api/edition-stats': fetch_edition_stats,
+}
+
+BOOTSTRAP_PAGES = {
+    'medals-evolution': ['/api/medal-tally', '/api/countries', '/api/games'],
+    'host-city-performance': ['/api/host-performance', '/api/countries', '/api/games'],
+}
+
+shared_results = LRUCache(max_bytes=int(os.environ.get('OLYMPIC_SHARED_RESULTS_MB', '16')) * 1024 * 1024)
+
+def batch_result(conn, path, fmt):
+    """Decoded result of one sub-request, shared across batches per dataset version."""
+    url = urlsplit(path)
+    fetch = BATCH_RESOURCES.get(url.path)
+    if fetch is None:
+        raise KeyError(url.path)
+    args = MultiDict(parse_qsl(url.query))
+    key = (url.path, normalized_args(args), fmt, DATASET_VERSION)
+    
+    def compute():
+        result = fetch(conn, args)
+        if url.path == '/api/host-performance':
+            if is_columnar(fmt):
+                return host_performance_columnar(result)
+            return [json.loads(payload) for payload in result]
+        columns, rows = result
+        if is_columnar(fmt):
+            return to_columnar(rows, columns)
+        return [dict(zip(columns, row)) for row in rows]
+    
+    return shared_results.get_or_compute(key, compute, lambda value: len(json.dumps(value)))
+
+def batch_response(paths):
+    fmt = negotiate_format()
+    formats = response_formats()
+    if fmt not in formats:
+        return unsupported_format(formats)
+    
+    results = {}
+    with db_pool.connection() as conn:
+        # One read transaction, so every sub-result comes from the same snapshot.
+        conn.execute('BEGIN')
+        try:
+            for path in paths:
+                try:
+                    results[path] = batch_result(conn, path, fmt)
+                except KeyError:
+                    return jsonify({"error": f"Unsupported batch request: {path}"}), 400
+                except ValueError:
+                    return jsonify({"error": f"Invalid parameters in batch request: {path}"}), 400
+        finally:
+            conn.rollback()
+    
+    return encoded_response({'dataset_version': DATASET_VERSION, 'results': results}, fmt)
+
+@app.route('/api/batch', methods=['GET', 'POST'])
+def batch():
+    """Run several read-only API requests in one round trip.
+    
+    GET /api/batch?path=/api/countries&path=/api/games or
+    POST {"requests": ["/api/countries", "/api/medal-tally?noc=USA"]}.
+    """
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        paths = body.get('requests', [])
+    else:
+        paths = request.args.getlist('path')
+    
+    if not paths or not all(isinstance(p, str) for p in paths):
+        return jsonify({"error": "Provide the sub-requests as a list of API paths"}), 400
+    
+    return batch_response(paths)
+
+@app.route('/api/bootstrap/<page>')
+@response_cache.cached()
+def bootstrap(page):
+    """All the data a page needs on load, in one cacheable response."""
+    if page not in BOOTSTRAP_PAGES:
+        return jsonify({"error": f"Unknown page '{page}'"}), 404
+    
+    return batch_response(BOOTSTRAP_PAGES[page])
 
 @app.route('/api/sport-country-matrix')
+@response_cache.cached(version_func=cube_data_version)
 def sport_country_matrix():
     medal_type = request.args.get('medal_type', 'total')
     year_range = request.args.get('year_range', 'recent')
-    country_count = int(request.args.get('country_count', '25'))
+    cluster_method = request.args.get('cluster_method', 'auto')
+    
+    try:
+        country_count = int(request.args.get('country_count', '25'))
+    except ValueError:
+        country_count = 0
+    if country_count < 1:
+        return jsonify({'error': 'country_count must be a positive integer'}), 400
+    if cluster_method not in CLUSTER_METHODS:
+        return jsonify({'error': f"cluster_method must be one of {', '.join(CLUSTER_METHODS)}"}), 400
     
-    print(f"Sport-country-matrix request with params: medal_type={medal_type}, year_range={year_range}, country_count={country_count}")
+    log.info("Sport-country-matrix request", extra={
+        'medal_type': medal_type,
+        'year_range': year_range,
+        'country_count': country_count,
+        'cluster_method': cluster_method,
+    })
     
     try:
-        import pandas as pd
-        import numpy as np
-        from scipy.cluster.hierarchy import linkage, fcluster
-        
-        year_filters = {
-            'all': (1896, 2022),
-            'recent': (2000, 2022),
-            '1990s': (1990, 1999),
-            '1980s': (1980, 1989),
-            '1970s': (1970, 1979),
-            'historical': (1896, 1969)
-        }
-        
-        year_min, year_max = year_filters.get(year_range, (2000, 2022))
-        print(f"Filtered for years: {year_min} to {year_max}")
-        
-        athlete_data = pd.read_csv('Olympic_Athlete_Event_Details.csv')
-        
-        summer_data = athlete_data[athlete_data['edition'].str.contains('Summer', na=False)]
-        
-        summer_data['year'] = summer_data['edition'].str.extract(r'(\d{4})').astype(int)
-        
-        filtered_data = summer_data[(summer_data['year'] >= year_min) & (summer_data['year'] <= year_max)]
-        print(f"After year filtering: {len(filtered_data)} records (from {len(summer_data)} summer records)")
-        
-        medal_data = filtered_data[filtered_data['medal'].notna()]
-        print(f"Medal winners in time range: {len(medal_data)}")
-        
-        medal_data['medal'] = medal_data['medal'].str.lower()
-        
-        medal_type = medal_type.lower()
-        
-        if medal_type != 'total':
-            medal_data = medal_data[medal_data['medal'].str.contains(medal_type)]
-            print(f"After medal type filtering ({medal_type}): {len(medal_data)} records")
+        result = cached_sport_country_matrix(medal_type, year_range, country_count, cluster_method)
         
-        country_sport_medals = medal_data.groupby(['country_noc', 'sport']).size().reset_index(name='count')
-        print(f"Country-sport combinations: {len(country_sport_medals)}")
+        fmt = negotiate_format()
+        if is_columnar(fmt):
+            result = dict(result, data=to_columnar(result['data'], HEATMAP_COLUMNS))
+            return encoded_response(result, fmt)
         
-        top_countries = medal_data.groupby('country_noc').size().nlargest(country_count).index.tolist()
-        print(f"Top {country_count} countries: {top_countries}")
-        
-        country_sport_medals = country_sport_medals[country_sport_medals['country_noc'].isin(top_countries)]
-        
-        top_sports = country_sport_medals['sport'].unique().tolist()
-        print(f"Sports with medals: {len(top_sports)}")
-        
-        matrix_data = country_sport_medals.pivot(index='country_noc', columns='sport', values='count').fillna(0)
-        
-        for sport in top_sports:
-            if sport not in matrix_data.columns:
-                matrix_data[sport] = 0
-        
-        country_distances = linkage(matrix_data.values, method='ward')
-        country_clusters = fcluster(country_distances, t=3, criterion='maxclust')
-        country_order = np.argsort(country_clusters)
-        
-        sport_distances = linkage(matrix_data.values.T, method='ward')
-        sport_clusters = fcluster(sport_distances, t=5, criterion='maxclust')
-        sport_order = np.argsort(sport_clusters)
-        
-        ordered_countries = [matrix_data.index[i] for i in country_order]
-        ordered_sports = [matrix_data.columns[i] for i in sport_order]
-        
-        country_profiles = pd.read_csv('Olympic_Country_Profiles.csv')
-        
-        country_map = dict(zip(country_profiles['noc'], country_profiles['country']))
-        
-        heatmap_data = []
-        for country in ordered_countries:
-            for sport in ordered_sports:
-                count = matrix_data.loc[country, sport] if sport in matrix_data.columns else 0
-                country_name = country_map.get(country, country)
-                
-                heatmap_data.append({
-                    'country': country,
-                    'country_name': country_name,
-                    'sport': sport,
-                    'value': int(count),
-                    'country_cluster': int(country_clusters[matrix_data.index.get_loc(country)]),
-                    'sport_cluster': int(sport_clusters[list(matrix_data.columns).index(sport)] if sport in matrix_data.columns else 0)
-                })
-        
-        result = {
-            'data': heatmap_data,
-            'countries': ordered_countries,
-            'sports': ordered_sports,
-            'max_value': int(max(d['value'] for d in heatmap_data)) if heatmap_data else 0,
-            'year_range': year_range,
-            'year_min': year_min,
-            'year_max': year_max
-        }
-        print(f"Returning heatmap with {len(heatmap_data)} data points, max value: {result['max_value']}")
-        return jsonify(result)
+        with stage('serialize'):
+            return jsonify(result)
     
+    except ComputeUnavailable as e:
+        return compute_unavailable(e)
     except Exception as e:
-        print(f"Error generating sport-country matrix: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error generating sport-country matrix")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/medal-flow')
+@response_cache.cached(version_func=cube_data_version)
 def medal_flow():
     medal_type = request.args.get('medal_type', 'total')
     flow_type = request.args.get('flow_type', 'year-sport-country')
-    node_limit = int(request.args.get('node_limit', '15'))
     
-    print(f"Medal-flow request with params: medal_type={medal_type}, flow_type={flow_type}, node_limit={node_limit}")
+    try:
+        node_limit = int(request.args.get('node_limit', '15'))
+    except ValueError:
+        node_limit = 0
+    if node_limit < 1:
+        return jsonify({'error': 'node_limit must be a positive integer'}), 400
+    if flow_type not in FLOW_TYPES:
+        return jsonify({'error': f"flow_type must be one of {', '.join(FLOW_TYPES)}"}), 400
+    
+    log.info("Medal-flow request", extra={
+        'medal_type': medal_type,
+        'flow_type': flow_type,
+        'node_limit': node_limit,
+    })
     
     try:
-        years = [1896, 1900, 1904, 1908, 1912, 1920, 1924, 1928, 1932, 1936, 1948, 1952, 
-                1956, 1960, 1964, 1968, 1972, 1976, 1980, 1984, 1988, 1992, 1996, 
-                2000, 2004, 2008, 2012, 2016, 2020]
-        
-        print(f"Using all Olympic years: {years}")
-        
-        sports = [
-            "Swimming", "Athletics", "Gymnastics", "Basketball", 
-            "Volleyball", "Football", "Tennis", "Cycling", 
-            "Boxing", "Judo", "Weightlifting", "Wrestling",
-            "Archery", "Badminton", "Canoeing", "Diving",
-            "Equestrian", "Fencing", "Field Hockey", "Golf",
-            "Handball", "Rowing", "Rugby", "Sailing",
-            "Shooting", "Table Tennis", "Taekwondo", "Triathlon",
-            "Water Polo"
-        ]
-        
-        countries = [
-            "United States", "China", "Russia", "Germany", 
-            "Japan", "Great Britain", "France", "Italy", 
-            "Australia", "South Korea", "Brazil", "Canada",
-            "Netherlands", "Spain", "Kenya", "Jamaica",
-            "New Zealand", "Cuba", "Hungary", "Ukraine", 
-            "Sweden", "Poland", "Romania", "Denmark",
-            "Switzerland", "Norway", "Croatia", "Greece", 
-            "Czech Republic", "Belgium"
-        ]
-        
-        sports = sports[:node_limit]
-        countries = countries[:node_limit]
-        
-        nodes = []
-        
-        for year in years:
-            nodes.append({
-                "name": str(year),
-                "color": "#1f77b4",
-                "type": "year"
-            })
-        
-        for sport in sports:
-            nodes.append({
-                "name": sport,
-                "color": "#ff7f0e",
-                "type": "sport"
-            })
-        
-        for country in countries:
-            nodes.append({
-                "name": country,
-                "color": "#2ca02c",
-                "type": "country"
-            })
-        
-        node_names = [node["name"] for node in nodes]
-        
-        print(f"Created {len(nodes)} nodes: {len(years)} years, {len(sports)} sports, {len(countries)} countries")
-        
-        links = []
-        
-        if flow_type == 'year-sport-country':
-            for year_idx, year in enumerate(years):
-                for sport_idx, sport in enumerate(sports):
-                    base_value = 10 + (year_idx % 5) + (sport_idx % 3)
-                    links.append({
-                        "source": node_names.index(str(year)),
-                        "target": node_names.index(sport),
-                        "value": base_value
-                    })
-            
-            for sport_idx, sport in enumerate(sports):
-                for country_idx, country in enumerate(countries):
-                    if (sport_idx + country_idx) % 4 != 3:
-                        base_value = 5 + ((sport_idx + country_idx) % 10)
-                        links.append({
-                            "source": node_names.index(sport),
-                            "target": node_names.index(country),
-                            "value": base_value
-                        })
-        else:
-            for year_idx, year in enumerate(years):
-                for country_idx, country in enumerate(countries):
-                    base_value = 15 + (year_idx % 5) + (country_idx % 5)
-                    links.append({
-                        "source": node_names.index(str(year)),
-                        "target": node_names.index(country),
-                        "value": base_value
-                    })
-            
-            for country_idx, country in enumerate(countries):
-                for sport_idx, sport in enumerate(sports):
-                    if (country_idx + sport_idx) % 4 != 3:
-                        base_value = 4 + ((country_idx + sport_idx) % 7)
-                        links.append({
-                            "source": node_names.index(country),
-                            "target": node_names.index(sport),
-                            "value": base_value
-                        })
-        
-        if medal_type == 'gold':
-            for link in links:
-                link["value"] = max(1, link["value"] // 3)
-        
-        print(f"Created {len(links)} links for {flow_type} flow with {medal_type} medals")
-        
-        result = {
-            "nodes": nodes,
-            "links": links,
-            "years": years
-        }
-        return jsonify(result)
+        result = cached_medal_flow(medal_type, flow_type, node_limit)
+        with stage('serialize'):
+            return jsonify(result)
         
+    except ComputeUnavailable as e:
+        return compute_unavailable(e)
     except Exception as e:
-        print(f"Error generating medal flow data: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Error generating medal flow data")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/host-advantage')
+@response_cache.cached()
+def host_advantage():
+    """Medal uplift of every host edition over the host's neighbouring editions.
+    
+    Optional parameters: medal_type (total, gold, silver or bronze), window
+    (editions on each side of the host edition, default 2), resamples
+    (bootstrap resamples, default 2000) and confidence (default 0.95).
+    """
+    try:
+        medal_type = request.args.get('medal_type', 'total').lower()
+        window = int(request.args.get('window', '2'))
+        resamples = int(request.args.get('resamples', '2000'))
+        confidence = float(request.args.get('confidence', '0.95'))
+    except ValueError:
+        return jsonify({'error': 'window and resamples must be integers and confidence a number'}), 400
+    
+    try:
+        result = cached_host_advantage(medal_type, window, resamples, confidence)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    fmt = negotiate_format()
+    if is_columnar(fmt):
+        result = dict(result, hosts=to_columnar(result['hosts'], HOST_ADVANTAGE_COLUMNS))
+        return encoded_response(result, fmt)
+    
+    with stage('serialize'):
+        return jsonify(result)
+
+IMPORT_MS = round((time.perf_counter() - _import_started) * 1000, 1)
+if IMPORT_MS > STARTUP_BUDGET_MS:
+    log.warning("app import took %s ms, over the %.0f ms startup budget", IMPORT_MS, STARTUP_BUDGET_MS)
+
+# Only the process that serves `python app.py` forks compute workers, not the
+# debug reloader's watcher, the CLI commands or scripts importing the app.
+# They are forked before any background thread exists.
+SERVING = __name__ == '__main__' and os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
+if STARTUP_MODE == 'eager':
+    warmup.run()
+    if SERVING:
+        compute_pool.start()
+else:
+    if SERVING:
+        compute_pool.start()
+    warmup.start()
+
 if __name__ == '__main__':
-    app.run(debug=True) 
\ No newline at end of file
+    app.run(debug=True) 
@@ -0,0 +1,475 @@
+import os
+import json
+import logging
+import shutil
+import threading
+import numpy as np
+from database import DATA_DIR, _BuildLock, append_csv_rows, source_fingerprint
+from observability import count_rows, stage
+
+log = logging.getLogger(__name__)
+
+ATHLETE_EVENTS_CSV = os.path.join(DATA_DIR, 'Olympic_Athlete_Event_Details.csv')
+CACHE_DIR = os.environ.get('OLYMPIC_ATHLETE_CACHE', os.path.join(DATA_DIR, 'athlete_events_cache'))
+
+# Memory the CSV reader may use for one parsed chunk, in MiB.
+INGEST_MEMORY_MB = float(os.environ.get('OLYMPIC_INGEST_MEMORY_MB', '64'))
+SAMPLE_ROWS = 1000
+
+# Bump whenever the on-disk column layout changes.
+CACHE_FORMAT_VERSION = 2
+
+MEDAL_TYPES = ['gold', 'silver', 'bronze']
+
+# Header spellings seen in the different exports of the athlete file,
+# mapped to the names used by the cache.
+COLUMN_ALIASES = {
+    'noc': 'country_noc',
+    'country_noc': 'country_noc',
+    'sport': 'sport',
+    'medal': 'medal',
+    'edition': 'edition',
+    'year': 'year',
+    'season': 'season',
+}
+
+CODED_COLUMNS = {
+    'sport': np.int16,
+    'country_noc': np.int16,
+}
+
+AGGREGATE_KEY = ['year', 'sport', 'country_noc', 'medal']
+
+_ingest_progress = {}
+_progress_lock = threading.Lock()
+
+
+def _encode(values, dtype):
+    import pandas as pd
+
+    codes, categories = pd.factorize(values, sort=True)
+    if len(categories) >= np.iinfo(dtype).max:
+        dtype = np.int32
+    return codes.astype(dtype), [str(c) for c in categories]
+
+
+def _medal_codes(medal):
+    import pandas as pd
+
+    lowered = pd.Series(medal, dtype='string').str.lower()
+    codes = np.full(len(medal), -1, dtype=np.int8)
+    for i, medal_type in enumerate(MEDAL_TYPES):
+        codes[lowered.str.contains(medal_type, na=False).to_numpy()] = i
+    return codes
+
+
+def _per_row(column, func, missing, dtype):
+    """Apply func to the categories of a categorical column and spread the
+    result over its rows, using missing for empty cells."""
+    values = np.append(np.asarray(func(column.cat.categories), dtype=dtype), np.array(missing, dtype=dtype))
+    return values[column.cat.codes.to_numpy()]
+
+
+def _csv_columns(csv_path):
+    """Map the CSV's header names of the columns we need to the cache names."""
+    import pandas as pd
+
+    header = pd.read_csv(csv_path, nrows=0).columns
+    return {name: COLUMN_ALIASES[name.lower()] for name in header if name.lower() in COLUMN_ALIASES}
+
+
+def chunk_rows_for(csv_path, columns, memory_mb=INGEST_MEMORY_MB):
+    """Rows per chunk that keep one parsed chunk within memory_mb.
+
+    The cost of a row is measured on a sample parsed into Python strings,
+    which is what the parser holds before converting a chunk to categories;
+    half of the budget is left for the filtered copy and the group-by.
+    """
+    import pandas as pd
+
+    sample = pd.read_csv(csv_path, usecols=list(columns), dtype=object, nrows=SAMPLE_ROWS)
+    row_bytes = max(sample.memory_usage(deep=True, index=False).sum() / max(len(sample), 1), 1)
+    return max(int(memory_mb * 1024 * 1024 / 2 / row_bytes), 100)
+
+
+def fold_medal_counts(chunk):
+    """Count the Summer medal rows of one chunk by (year, sport, NOC, medal).
+
+    Every column is categorical, so the string work (medal names, season,
+    year parsing) runs once per distinct value rather than once per row.
+    """
+    import pandas as pd
+
+    def parse_year(values):
+        if 'year' not in chunk.columns:
+            values = pd.Series(values, dtype='string').str.extract(r'(\d{4})', expand=False)
+        return pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').astype(float)
+
+    year = _per_row(chunk['year' if 'year' in chunk.columns else 'edition'], parse_year, np.nan, float)
+    season = chunk['season'] if 'season' in chunk.columns else chunk['edition']
+    is_summer = _per_row(
+        season, lambda c: pd.Series(c, dtype='string').str.contains('Summer', na=False), False, np.bool_)
+    medal = _per_row(chunk['medal'], _medal_codes, -1, np.int8)
+
+    keep = is_summer & (medal >= 0)
+    kept = pd.DataFrame({
+        'year': np.nan_to_num(year[keep]).astype(np.int16),
+        'sport': chunk['sport'].to_numpy(dtype=object)[keep],
+        'country_noc': chunk['country_noc'].to_numpy(dtype=object)[keep],
+        'medal': medal[keep].astype(np.int8),
+    })
+    kept[['sport', 'country_noc']] = kept[['sport', 'country_noc']].fillna('')
+    return kept.groupby(AGGREGATE_KEY).size(), int(keep.sum())
+
+
+def _report_progress(**fields):
+    with _progress_lock:
+        _ingest_progress.update(fields)
+
+
+def ingest_progress():
+    """State of the current (or last) athlete-event ingestion."""
+    with _progress_lock:
+        return dict(_ingest_progress)
+
+
+def aggregate_athlete_events(csv_path=ATHLETE_EVENTS_CSV, memory_mb=INGEST_MEMORY_MB):
+    """Stream the athlete-event CSV into Summer medal counts.
+
+    The file is read in chunks sized from memory_mb, so peak memory depends
+    on the budget and on the number of distinct (year, sport, NOC, medal)
+    keys, not on the number of rows. Returns the counts as a Series indexed
+    by AGGREGATE_KEY, with the rows read and kept.
+    """
+    import pandas as pd
+
+    columns = _csv_columns(csv_path)
+    chunk_rows = chunk_rows_for(csv_path, columns, memory_mb)
+    total_bytes = max(os.path.getsize(csv_path), 1)
+    totals = pd.Series([], dtype=np.int64, index=pd.MultiIndex.from_arrays([[]] * 4, names=AGGREGATE_KEY))
+    pending, pending_rows = [], 0
+    rows = kept = 0
+    _report_progress(state='running', file=os.path.basename(csv_path), fraction=0.0, rows=0, medal_rows=0,
+                     chunk_rows=chunk_rows)
+
+    with open(csv_path, 'rb') as f:
+        reader = pd.read_csv(f, usecols=list(columns), dtype='category', chunksize=chunk_rows)
+        while True:
+            with stage('csv_load'):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            chunk.columns = [columns[c] for c in chunk.columns]
+            count_rows('scanned', len(chunk))
+            with stage('groupby'):
+                counts, chunk_kept = fold_medal_counts(chunk)
+                pending.append(counts)
+                pending_rows += len(counts)
+                # Merge once the pending counts are as large as the totals,
+                # so each key is re-summed a bounded number of times.
+                if pending_rows >= max(len(totals), chunk_rows):
+                    totals = pd.concat([totals, *pending]).groupby(level=AGGREGATE_KEY).sum()
+                    pending, pending_rows = [], 0
+            rows += len(chunk)
+            kept += chunk_kept
+            fraction = round(min(f.tell() / total_bytes, 1.0), 3)
+            _report_progress(fraction=fraction, rows=rows, medal_rows=kept)
+            log.info("Ingested %d athlete event rows (%.0f%%), %d medal rows kept",
+                     rows, fraction * 100, kept,
+                     extra={'rows': rows, 'medal_rows': kept, 'progress': fraction})
+
+    if pending:
+        totals = pd.concat([totals, *pending]).groupby(level=AGGREGATE_KEY).sum()
+    _report_progress(state='done', fraction=1.0)
+    return totals.astype(np.int64), rows, kept
+
+
+def convert_athlete_events(csv_path=ATHLETE_EVENTS_CSV, target_dir=None):
+    """Write the Summer medal counts of the athlete-event CSV as typed,
+    int-coded column files, one row per (year, sport, NOC, medal).
+
+    Returns the manifest describing the written columns.
+    """
+    totals, source_rows, medal_rows = aggregate_athlete_events(csv_path)
+    return write_medal_counts(totals, target_dir, source_rows, medal_rows)
+
+
+def write_medal_counts(totals, target_dir, source_rows, medal_rows):
+    """Write counts indexed by AGGREGATE_KEY as column files; returns the manifest."""
+    keys = totals.index.to_frame(index=False)
+
+    columns = {
+        'year': keys['year'].to_numpy(dtype=np.int16),
+        'medal': keys['medal'].to_numpy(dtype=np.int8),
+        'count': totals.to_numpy(dtype=np.int32),
+    }
+    categories = {'medal': MEDAL_TYPES}
+    for name, dtype in CODED_COLUMNS.items():
+        columns[name], categories[name] = _encode(keys[name].to_numpy(dtype=object), dtype)
+
+    os.makedirs(target_dir, exist_ok=True)
+    manifest = {
+        'format_version': CACHE_FORMAT_VERSION,
+        'rows': len(totals),
+        'source_rows': source_rows,
+        'medal_rows': medal_rows,
+        'columns': {},
+        'categories': categories,
+    }
+    for name, values in columns.items():
+        values.tofile(os.path.join(target_dir, f'{name}.bin'))
+        manifest['columns'][name] = values.dtype.str
+    return manifest
+
+
+def _read_pointer():
+    try:
+        with open(os.path.join(CACHE_DIR, 'current.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def ensure_athlete_cache(csv_path=ATHLETE_EVENTS_CSV, force=False):
+    """Convert the athlete-event CSV if the cache is missing or stale.
+
+    Returns the directory holding the current columns, or None when the
+    CSV is not available.
+    """
+    if not os.path.exists(csv_path):
+        return None
+
+    def is_current(pointer, fingerprint):
+        return (not force and pointer
+                and pointer['format_version'] == CACHE_FORMAT_VERSION
+                and pointer['fingerprint'][name]['sha256'] == fingerprint[name]['sha256'])
+
+    name = os.path.basename(csv_path)
+    pointer = _read_pointer()
+    fingerprint = source_fingerprint([csv_path], previous=pointer['fingerprint'] if pointer else None)
+    if is_current(pointer, fingerprint):
+        return os.path.join(CACHE_DIR, pointer['directory'])
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _BuildLock(os.path.join(CACHE_DIR, 'build.lock')):
+        # Another process (e.g. a compute worker) may have converted it meanwhile.
+        pointer = _read_pointer()
+        if is_current(pointer, fingerprint):
+            return os.path.join(CACHE_DIR, pointer['directory'])
+
+        target_dir, manifest = _publish(
+            fingerprint, pointer, lambda target_dir: convert_athlete_events(csv_path, target_dir))
+
+    log.info("Aggregated %d athlete event records (%d medals) into %d counts in %s",
+             manifest['source_rows'], manifest['medal_rows'], manifest['rows'], target_dir)
+    return target_dir
+
+
+def _publish(fingerprint, pointer, write):
+    """Write a new cache directory with write(target_dir) and make it current.
+
+    Call with the build lock held. Returns the directory and its manifest.
+    """
+    (entry,) = fingerprint.values()
+    directory = f"{entry['sha256'][:16]}-{os.getpid()}"
+    target_dir = os.path.join(CACHE_DIR, directory)
+    manifest = write(target_dir)
+    manifest['fingerprint'] = fingerprint
+    with open(os.path.join(target_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    # Publish the new directory by atomically swapping the pointer file.
+    tmp_pointer = os.path.join(CACHE_DIR, f'current.json.tmp-{os.getpid()}')
+    with open(tmp_pointer, 'w') as f:
+        json.dump({
+            'format_version': CACHE_FORMAT_VERSION,
+            'directory': directory,
+            'fingerprint': fingerprint,
+        }, f)
+    os.replace(tmp_pointer, os.path.join(CACHE_DIR, 'current.json'))
+
+    if pointer and pointer['directory'] != directory:
+        shutil.rmtree(os.path.join(CACHE_DIR, pointer['directory']), ignore_errors=True)
+    return target_dir, manifest
+
+
+def read_new_athlete_events(rows_csv):
+    """Read athlete-event rows to append, with the cache's column names."""
+    import pandas as pd
+
+    columns = _csv_columns(rows_csv)
+    rows = pd.read_csv(rows_csv, usecols=list(columns), dtype='category')
+    rows.columns = [columns[c] for c in rows.columns]
+    return rows
+
+
+def append_athlete_events(rows_csv, csv_path=ATHLETE_EVENTS_CSV):
+    """Append new athlete-event rows to csv_path and add their medals to the
+    current counts, without re-reading the rest of the file.
+
+    Returns the new cache directory.
+    """
+    import pandas as pd
+
+    directory = ensure_athlete_cache(csv_path)
+    if directory is None:
+        raise FileNotFoundError(f"{csv_path} not found")
+
+    with _BuildLock(os.path.join(CACHE_DIR, 'build.lock')):
+        pointer = _read_pointer()
+        store = AthleteEventStore(os.path.join(CACHE_DIR, pointer['directory']))
+        rows = read_new_athlete_events(rows_csv)
+        counts, kept = fold_medal_counts(rows)
+        totals = pd.concat([store.medal_counts(), counts]).groupby(level=AGGREGATE_KEY).sum()
+
+        append_csv_rows(csv_path, pd.read_csv(rows_csv))
+        fingerprint = source_fingerprint([csv_path], previous=pointer['fingerprint'])
+        target_dir, manifest = _publish(fingerprint, pointer, lambda target_dir: write_medal_counts(
+            totals, target_dir,
+            store.manifest['source_rows'] + len(rows),
+            store.manifest['medal_rows'] + kept,
+        ))
+
+    log.info("Appended %d athlete event records (%d medals) to %s", len(rows), kept, target_dir)
+    return target_dir
+
+
+class AthleteEventStore:
+    """Memory-mapped, column-selective view over the aggregated medal counts."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.rows = self.manifest['rows']
+        self.version = '-'.join(
+            entry['sha256'][:16] for _, entry in sorted(self.manifest['fingerprint'].items())
+        )
+        self._columns = {}
+
+    def column(self, name):
+        if name not in self._columns:
+            dtype = np.dtype(self.manifest['columns'][name])
+            path = os.path.join(self.directory, f'{name}.bin')
+            if self.rows == 0:
+                self._columns[name] = np.empty(0, dtype=dtype)
+            else:
+                self._columns[name] = np.memmap(path, dtype=dtype, mode='r', shape=(self.rows,))
+        return self._columns[name]
+
+    def columns(self, *names):
+        return [self.column(name) for name in names]
+
+    def categories(self, name):
+        return self.manifest['categories'][name]
+
+    def decode(self, name, codes):
+        """Map an array of codes back to their category values."""
+        return np.asarray(self.categories(name), dtype=object)[codes]
+
+    def medal_counts(self):
+        """The stored counts as a Series indexed by AGGREGATE_KEY."""
+        import pandas as pd
+
+        year, sport, noc, medal, count = self.columns('year', 'sport', 'country_noc', 'medal', 'count')
+        index = pd.MultiIndex.from_arrays([
+            np.asarray(year),
+            self.decode('sport', np.asarray(sport)),
+            self.decode('country_noc', np.asarray(noc)),
+            np.asarray(medal),
+        ], names=AGGREGATE_KEY)
+        return pd.Series(np.asarray(count, dtype=np.int64), index=index)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_athlete_store():
+    """Return the shared store, converting the CSV on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            directory = ensure_athlete_cache()
+            if directory is None:
+                raise FileNotFoundError(f"{ATHLETE_EVENTS_CSV} not found")
+            _store = AthleteEventStore(directory)
+    return _store
+
+
+class MedalCube:
+    """Dense year x sport x NOC x medal-type count cube of Summer medals.
+
+    The index maps are fixed when the cube is built, so sport timelines and
+    country x sport matrices become slices and sums over one array.
+    """
+
+    def __init__(self, store):
+        year, sport, noc, medal, count = store.columns('year', 'sport', 'country_noc', 'medal', 'count')
+
+        self.years = np.unique(year).astype(np.int64)
+        self.sports = list(store.categories('sport'))
+        self.nocs = list(store.categories('country_noc'))
+        self.medal_types = list(MEDAL_TYPES)
+        self.version = store.version
+
+        self.year_index = {int(y): i for i, y in enumerate(self.years)}
+        self.sport_index = {s: i for i, s in enumerate(self.sports)}
+        self.noc_index = {n: i for i, n in enumerate(self.nocs)}
+
+        shape = (len(self.years), len(self.sports), len(self.nocs), len(self.medal_types))
+        flat = np.ravel_multi_index((
+            np.searchsorted(self.years, year),
+            sport.astype(np.int64),
+            noc.astype(np.int64),
+            medal.astype(np.int64),
+        ), shape)
+        self.counts = np.bincount(flat, weights=count, minlength=int(np.prod(shape))).astype(np.int32).reshape(shape)
+
+        log.info("Built medal cube %s from %d medal records using %.1f MiB",
+                 shape, int(count.sum()), self.counts.nbytes / (1024 * 1024))
+
+    def year_slice(self, year_min, year_max):
+        """Slice of the year axis covering year_min..year_max inclusive."""
+        return slice(
+            int(np.searchsorted(self.years, year_min, side='left')),
+            int(np.searchsorted(self.years, year_max, side='right')),
+        )
+
+    def medal_axis(self, counts, medal_type):
+        """Collapse the trailing medal axis for 'total' or pick one medal type."""
+        if medal_type == 'total':
+            return counts.sum(axis=-1)
+        if medal_type in self.medal_types:
+            return counts[..., self.medal_types.index(medal_type)]
+        return np.zeros(counts.shape[:-1], dtype=counts.dtype)
+
+
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def get_medal_cube():
+    """Return the shared medal cube, building it on first use."""
+    global _cube
+    with _cube_lock:
+        if _cube is None:
+            _cube = MedalCube(get_athlete_store())
+    return _cube
+
+
+def refresh_medal_cube():
+    """Drop the shared store and cube if another process published new counts.
+
+    Returns True when they were dropped; the next get_medal_cube() call
+    builds the cube from the new counts.
+    """
+    global _store, _cube
+    pointer = _read_pointer()
+    with _cube_lock, _store_lock:
+        if _store is None or pointer is None:
+            return False
+        if os.path.join(CACHE_DIR, pointer['directory']) == _store.directory:
+            return False
+        _store = _cube = None
+    return True
@@ -0,0 +1,531 @@
+"""Endpoint benchmarks against synthetic datasets of a chosen scale.
+
+    python benchmark.py generate --scale 100 --out benchmarks/data-100x
+    python benchmark.py run --scale 100 --output benchmarks/100x.json
+    python benchmark.py compare benchmarks/100x.json benchmarks/100x-new.json
+    python benchmark.py memory --scale 10
+
+The generator multiplies the bundled CSVs: editions are repeated in later
+"eras" and every country gets synthetic clones with jittered medal counts,
+so the row count of the medal tally and athlete-event files grows by about
+the scale factor. Each run uses its own data directory, database and
+athlete cache, so the bundled data is never touched.
+
+The memory command checks each endpoint's peak allocation and RSS growth
+against recorded budgets and lists the source lines allocating the most.
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+import resource
+import threading
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Query strings to request for each /api route; routes not listed are
+# requested once without arguments.
+BENCHMARK_QUERIES = {
+    '/api/country_medals': ['country=United States'],
+    '/api/sport_medals': ['sport=Swimming'],
+    '/api/medal-tally': ['', 'format=columnar', 'year_min=2000&limit=100'],
+    '/api/host-performance': ['', 'format=columnar'],
+    '/api/edition-stats': ['', 'noc=USA,CHN&year_min=2000'],
+    '/api/sport-country-matrix': ['', 'year_range=all&country_count=50'],
+    '/api/medal-flow': ['', 'node_limit=50'],
+    '/api/host-advantage': ['', 'resamples=10000'],
+    '/api/batch': ['path=/api/countries&path=/api/games'],
+    '/api/bootstrap/<page>': None,
+}
+
+# Routes with URL arguments, expanded to concrete paths.
+BENCHMARK_PATHS = {
+    '/api/bootstrap/<page>': ['/api/bootstrap/medals-evolution', '/api/bootstrap/host-city-performance'],
+}
+
+SPORTS = ['Athletics', 'Swimming', 'Gymnastics', 'Cycling', 'Rowing', 'Boxing', 'Fencing',
+          'Wrestling', 'Shooting', 'Sailing', 'Judo', 'Art Competitions']
+
+# Non-medal athlete rows generated per medal tally row.
+NON_MEDAL_ROWS = 5
+
+# A run is flagged when a latency grows, or throughput drops, by more than this share.
+DEFAULT_THRESHOLD = 0.2
+
+# Budgets recorded with --record allow this much growth over the measurement,
+# and never less than MIN_BUDGET_BYTES. RSS growth depends on what the
+# allocator still holds from earlier requests, so its budget is at least
+# twice the traced peak.
+BUDGET_HEADROOM = 1.5
+MIN_BUDGET_BYTES = 1024 * 1024
+MIN_RSS_BUDGET_BYTES = 4 * 1024 * 1024
+
+# How often the memory sampler checks traced memory and RSS, in seconds.
+MEMORY_SAMPLE_INTERVAL = 0.002
+
+
+def scale_factors(scale):
+    """Split a scale factor into (edition copies, country copies)."""
+    editions = max(1, round(scale ** (1 / 3)))
+    return editions, max(1, round(scale / editions))
+
+
+def generate(scale, out_dir, seed=0):
+    """Write scaled copies of the source CSVs into out_dir."""
+    import numpy as np
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    edition_copies, country_copies = scale_factors(scale)
+    os.makedirs(out_dir, exist_ok=True)
+
+    countries = pd.read_csv(os.path.join(BASE_DIR, 'Olympic_Country_Profiles.csv'))
+    games = pd.read_csv(os.path.join(BASE_DIR, 'Olympic_Games_Summary.csv'))
+    tally = pd.read_csv(os.path.join(BASE_DIR, 'Olympic_Medal_Tally_History.csv'))
+
+    def clone_noc(noc, copy):
+        return noc if copy == 0 else f'{noc}{copy}'
+
+    countries = pd.concat([
+        countries.assign(noc=countries['noc'].map(lambda n: clone_noc(n, c)),
+                         country=countries['country'] if c == 0 else countries['country'] + f' {c}')
+        for c in range(country_copies)
+    ], ignore_index=True)
+
+    # Later eras repeat every edition with shifted years and ids.
+    span = int(games['year'].max() - games['year'].min()) + 4
+    id_step = int(games['edition_id'].max())
+    season = games['edition'].str.extract(r'(Summer|Winter)', expand=False).fillna('Summer')
+    eras = []
+    for era in range(edition_copies):
+        copy = games.copy()
+        copy['year'] = games['year'] + era * span
+        copy['edition_id'] = games['edition_id'] + era * id_step
+        copy['edition'] = copy['year'].astype(str) + ' ' + season + ' Olympics'
+        eras.append(copy)
+    games = pd.concat(eras, ignore_index=True)
+
+    year_of = dict(zip(games['edition_id'], games['year']))
+    edition_of = dict(zip(games['edition_id'], games['edition']))
+    tallies = []
+    for era in range(edition_copies):
+        for c in range(country_copies):
+            copy = tally.copy()
+            copy['edition_id'] = tally['edition_id'] + era * id_step
+            copy['country_noc'] = tally['country_noc'].map(lambda n: clone_noc(n, c))
+            if c:
+                copy['country'] = tally['country'] + f' {c}'
+            if era or c:
+                for medal in ('gold', 'silver', 'bronze'):
+                    copy[medal] = np.rint(tally[medal] * rng.uniform(0.5, 1.5, len(tally))).astype(int)
+            tallies.append(copy)
+    tally = pd.concat(tallies, ignore_index=True)
+    tally['year'] = tally['edition_id'].map(year_of)
+    tally['edition'] = tally['edition_id'].map(edition_of)
+    tally['total'] = tally['gold'] + tally['silver'] + tally['bronze']
+
+    # One athlete row per medal plus a few non-medal entries per tally row.
+    medal_names = np.array(['Gold', 'Silver', 'Bronze', ''], dtype=object)
+    counts = np.column_stack([tally['gold'], tally['silver'], tally['bronze'],
+                              np.full(len(tally), NON_MEDAL_ROWS)]).astype(np.int64)
+    row_idx = np.repeat(np.arange(len(tally)), counts.sum(axis=1))
+    medal_idx = np.repeat(np.tile(np.arange(4), len(tally)), counts.ravel())
+    athletes = pd.DataFrame({
+        'edition': tally['edition'].to_numpy()[row_idx],
+        'edition_id': tally['edition_id'].to_numpy()[row_idx],
+        'country_noc': tally['country_noc'].to_numpy()[row_idx],
+        'sport': np.asarray(SPORTS, dtype=object)[rng.integers(0, len(SPORTS), len(row_idx))],
+        'event': 'Event',
+        'result_id': 1,
+        'athlete': 'X',
+        'athlete_id': np.arange(1, len(row_idx) + 1),
+        'pos': np.where(medal_idx < 3, 1, 10),
+        'medal': medal_names[medal_idx],
+        'isTeamSport': False,
+    })
+
+    countries.to_csv(os.path.join(out_dir, 'Olympic_Country_Profiles.csv'), index=False)
+    games.to_csv(os.path.join(out_dir, 'Olympic_Games_Summary.csv'), index=False)
+    tally.to_csv(os.path.join(out_dir, 'Olympic_Medal_Tally_History.csv'), index=False)
+    athletes.to_csv(os.path.join(out_dir, 'Olympic_Athlete_Event_Details.csv'), index=False)
+
+    summary = {
+        'scale': scale,
+        'edition_copies': edition_copies,
+        'country_copies': country_copies,
+        'countries': len(countries),
+        'games': len(games),
+        'tally_rows': len(tally),
+        'athlete_rows': len(athletes),
+    }
+    with open(os.path.join(out_dir, 'dataset.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def _configure_environment(data_dir):
+    os.environ['OLYMPIC_DATA_DIR'] = data_dir
+    os.environ['OLYMPIC_DB_PATH'] = os.path.join(data_dir, 'olympic_data.db')
+    os.environ.setdefault('OLYMPIC_STARTUP', 'eager')
+    os.environ.setdefault('OLYMPIC_PREWARM', '0')
+    os.environ.setdefault('OLYMPIC_LOG_LEVEL', 'CRITICAL')
+
+
+def benchmark_urls(app):
+    """Every /api GET route with the query strings to benchmark it with."""
+    urls = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda r: r.rule):
+        if not rule.rule.startswith('/api/') or 'GET' not in rule.methods:
+            continue
+        paths = BENCHMARK_PATHS.get(rule.rule, [rule.rule])
+        if rule.arguments and rule.rule not in BENCHMARK_PATHS:
+            continue
+        for path in paths:
+            for query in BENCHMARK_QUERIES.get(rule.rule) or ['']:
+                urls.append(f'{path}?{query}' if query else path)
+    return urls
+
+
+def clear_caches(app_module):
+    """Drop every response and result cache, leaving the loaded data in place."""
+    from analytics import distance_cache
+
+    app_module.response_cache.clear()
+    for cache in (app_module.matrix_cache, app_module.flow_cache, app_module.shared_results,
+                  app_module.host_advantage_cache, distance_cache):
+        cache.invalidate()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    k = (len(ordered) - 1) * q
+    lo, hi = math.floor(k), math.ceil(k)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def measure(client, app_module, url, requests, cached):
+    latencies = []
+    size = 0
+    status = None
+    client.get(url).get_data()
+    started = time.perf_counter()
+    for _ in range(requests):
+        if not cached:
+            clear_caches(app_module)
+        start = time.perf_counter()
+        response = client.get(url)
+        body = response.get_data()
+        latencies.append((time.perf_counter() - start) * 1000)
+        size, status = len(body), response.status_code
+    elapsed = time.perf_counter() - started
+
+    if not cached:
+        clear_caches(app_module)
+    tracemalloc.start()
+    client.get(url).get_data()
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'status': status,
+        'requests': requests,
+        'bytes': size,
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'p50_ms': round(percentile(latencies, 0.5), 3),
+        'p90_ms': round(percentile(latencies, 0.9), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'max_ms': round(max(latencies), 3),
+        'throughput_rps': round(requests / elapsed, 2),
+        'peak_alloc_bytes': peak_alloc,
+    }
+
+
+def _max_rss_bytes():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _current_rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return _max_rss_bytes()
+
+
+class MemorySampler:
+    """Tracks the peak of tracemalloc's traced memory and of RSS while a
+    request runs, snapshotting the allocations whenever the traced peak has
+    grown by a tenth, so the heaviest lines at (about) the peak are known.
+    """
+
+    def __init__(self, interval=MEMORY_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.base_rss = _current_rss_bytes()
+        self.peak_rss = self.base_rss
+        self.snapshot = None
+        self._snapshot_size = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self):
+        self.peak_rss = max(self.peak_rss, _current_rss_bytes())
+        current, _ = tracemalloc.get_traced_memory()
+        if current > self._snapshot_size * 1.1:
+            self.snapshot = tracemalloc.take_snapshot()
+            self._snapshot_size = current
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def _short_path(filename):
+    if filename.startswith(BASE_DIR + os.sep):
+        return os.path.relpath(filename, BASE_DIR)
+    return os.path.join(*filename.split(os.sep)[-2:])
+
+
+def measure_memory(client, app_module, url, top=5):
+    """Peak traced allocation, RSS growth and top allocating lines of one cold request."""
+    client.get(url).get_data()
+    clear_caches(app_module)
+
+    tracemalloc.start(1)
+    baseline = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    with MemorySampler() as sampler:
+        response = client.get(url)
+        response.get_data()
+    _, peak_alloc = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Leave out the sampler's own allocations.
+    filters = [tracemalloc.Filter(False, module.__file__) for module in (tracemalloc, threading)]
+    filters.append(tracemalloc.Filter(False, __file__))
+    snapshot = (sampler.snapshot or baseline).filter_traces(filters)
+    top_lines = [
+        {
+            'line': f'{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}',
+            'bytes': stat.size_diff,
+            'blocks': stat.count_diff,
+        }
+        for stat in snapshot.compare_to(baseline.filter_traces(filters), 'lineno')[:top]
+        if stat.size_diff > 0
+    ]
+    return {
+        'status': response.status_code,
+        'peak_alloc_bytes': peak_alloc,
+        'rss_delta_bytes': max(sampler.peak_rss - sampler.base_rss, 0),
+        'top_lines': top_lines,
+    }
+
+
+def check_budgets(measured, budgets, metrics=('peak_alloc_bytes', 'rss_delta_bytes')):
+    """List the endpoints exceeding their budget as strings."""
+    failures = []
+    for url, result in measured.items():
+        budget = budgets.get(url)
+        if budget is None:
+            failures.append(f'{url}: no memory budget recorded')
+            continue
+        for metric in metrics:
+            if result[metric] > budget[metric]:
+                failures.append(f'{url}: {metric} {result[metric] / 2 ** 20:.1f} MiB over its '
+                                f'{budget[metric] / 2 ** 20:.1f} MiB budget')
+    return failures
+
+
+def _load_app(data_dir):
+    """Import app.py against the dataset in data_dir; returns (module, import ms)."""
+    _configure_environment(data_dir)
+    sys.path.insert(0, BASE_DIR)
+
+    start = time.perf_counter()
+    import app as app_module
+    return app_module, (time.perf_counter() - start) * 1000
+
+
+def _selected(urls, only):
+    return [url for url in urls if not only or any(part in url for part in only)]
+
+
+def _read_dataset(data_dir):
+    dataset_file = os.path.join(data_dir, 'dataset.json')
+    if not os.path.exists(dataset_file):
+        return {}
+    with open(dataset_file) as f:
+        return json.load(f)
+
+
+def memory(data_dir, only=None, top=5):
+    """Measure every /api endpoint's memory use against the dataset in data_dir."""
+    app_module, _ = _load_app(data_dir)
+    client = app_module.app.test_client()
+    measured = {}
+    for url in _selected(benchmark_urls(app_module.app), only):
+        measured[url] = result = measure_memory(client, app_module, url, top)
+        print(f"{url:60} peak {result['peak_alloc_bytes'] / 2 ** 20:7.1f} MiB  "
+              f"rss +{result['rss_delta_bytes'] / 2 ** 20:6.1f} MiB")
+        for line in result['top_lines']:
+            print(f"    {line['bytes'] / 2 ** 20:7.2f} MiB in {line['blocks']:6d} blocks  {line['line']}")
+    return measured
+
+
+def run(data_dir, requests=20, cached=False, only=None):
+    """Benchmark every /api endpoint against the dataset in data_dir."""
+    app_module, startup_ms = _load_app(data_dir)
+
+    client = app_module.app.test_client()
+    endpoints = {}
+    for url in _selected(benchmark_urls(app_module.app), only):
+        endpoints[url] = measure(client, app_module, url, requests, cached)
+        result = endpoints[url]
+        print(f"{url:60} p50 {result['p50_ms']:9.2f} ms  p99 {result['p99_ms']:9.2f} ms  "
+              f"{result['throughput_rps']:8.1f} req/s  peak {result['peak_alloc_bytes'] / 2 ** 20:7.1f} MiB")
+
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'dataset': _read_dataset(data_dir),
+        'cached': cached,
+        'startup_ms': round(startup_ms, 1),
+        'import_ms': app_module.IMPORT_MS,
+        'peak_rss_bytes': _max_rss_bytes(),
+        'endpoints': endpoints,
+    }
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """List the regressions of current against baseline as strings."""
+    regressions = []
+    for url, before in baseline['endpoints'].items():
+        after = current['endpoints'].get(url)
+        if after is None:
+            regressions.append(f'{url}: missing from the current run')
+            continue
+        if after['status'] != before['status']:
+            regressions.append(f"{url}: status {before['status']} -> {after['status']}")
+        for metric in ('p50_ms', 'p90_ms', 'peak_alloc_bytes'):
+            if before[metric] and after[metric] > before[metric] * (1 + threshold):
+                regressions.append(f'{url}: {metric} {before[metric]} -> {after[metric]} '
+                                   f'(+{after[metric] / before[metric] - 1:.0%})')
+        if after['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{url}: throughput_rps {before['throughput_rps']} -> {after['throughput_rps']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    gen = commands.add_parser('generate', help='write a scaled synthetic dataset')
+    gen.add_argument('--scale', type=int, default=10)
+    gen.add_argument('--out', help='target directory (default benchmarks/data-<scale>x)')
+    gen.add_argument('--seed', type=int, default=0)
+
+    bench = commands.add_parser('run', help='benchmark every /api endpoint')
+    bench.add_argument('--scale', type=int, default=1, help='generate this scale if --data-dir is not given')
+    bench.add_argument('--data-dir')
+    bench.add_argument('--requests', type=int, default=20, help='timed requests per endpoint')
+    bench.add_argument('--cached', action='store_true', help='keep response and result caches between requests')
+    bench.add_argument('--only', nargs='*', help='only URLs containing one of these strings')
+    bench.add_argument('--output', help='write the results here as JSON')
+
+    cmp_ = commands.add_parser('compare', help='flag regressions between two runs')
+    cmp_.add_argument('baseline')
+    cmp_.add_argument('current')
+    cmp_.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    mem = commands.add_parser('memory', help='check per-endpoint memory use against budgets')
+    mem.add_argument('--scale', type=int, default=1, help='generate this scale if --data-dir is not given')
+    mem.add_argument('--data-dir')
+    mem.add_argument('--only', nargs='*', help='only URLs containing one of these strings')
+    mem.add_argument('--top', type=int, default=5, help='allocating lines to list per endpoint')
+    mem.add_argument('--budgets', help='budget file (default benchmarks/memory_budgets-<scale>x.json)')
+    mem.add_argument('--record', action='store_true', help='write new budgets from this run instead of checking')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        out = args.out or os.path.join(BASE_DIR, 'benchmarks', f'data-{args.scale}x')
+        print(json.dumps(generate(args.scale, out, args.seed), indent=2))
+        return 0
+
+    data_dir = getattr(args, 'data_dir', None)
+    if args.command in ('run', 'memory') and data_dir is None:
+        data_dir = os.path.join(BASE_DIR, 'benchmarks', f'data-{args.scale}x')
+        if not os.path.exists(os.path.join(data_dir, 'dataset.json')):
+            generate(args.scale, data_dir)
+
+    if args.command == 'memory':
+        args.budgets = args.budgets or os.path.join(BASE_DIR, 'benchmarks', f'memory_budgets-{args.scale}x.json')
+        measured = memory(os.path.abspath(data_dir), args.only, args.top)
+        if args.record:
+            budgets = {
+                'dataset': _read_dataset(data_dir),
+                'endpoints': {
+                    url: {
+                        'peak_alloc_bytes': max(int(result['peak_alloc_bytes'] * BUDGET_HEADROOM), MIN_BUDGET_BYTES),
+                        'rss_delta_bytes': max(
+                            int(max(result['rss_delta_bytes'], 2 * result['peak_alloc_bytes']) * BUDGET_HEADROOM),
+                            MIN_RSS_BUDGET_BYTES),
+                    }
+                    for url, result in measured.items()
+                },
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(args.budgets)), exist_ok=True)
+            with open(args.budgets, 'w') as f:
+                json.dump(budgets, f, indent=2, sort_keys=True)
+            print(f"Recorded budgets for {len(measured)} endpoints in {args.budgets}")
+            return 0
+        with open(args.budgets) as f:
+            budgets = json.load(f)
+        # RSS growth depends on the requests that ran before, so it is only
+        # comparable to the budget in a full run.
+        metrics = ('peak_alloc_bytes',) if args.only else ('peak_alloc_bytes', 'rss_delta_bytes')
+        failures = check_budgets(measured, budgets['endpoints'], metrics)
+        for line in failures:
+            print(f'OVER BUDGET {line}')
+        if not failures:
+            print(f"All {len(measured)} endpoints within their memory budgets")
+        return 1 if failures else 0
+
+    if args.command == 'run':
+        results = run(os.path.abspath(data_dir), args.requests, args.cached, args.only)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent=2)
+        print(f"Startup {results['startup_ms']} ms, peak RSS {results['peak_rss_bytes'] / 2 ** 20:.0f} MiB")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for line in regressions:
+        print(f'REGRESSION {line}')
+    if not regressions:
+        print(f"No regressions over {args.threshold:.0%} across {len(baseline['endpoints'])} endpoints")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,324 @@
+import gzip
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from functools import wraps
+
+from flask import request, make_response
+
+# Query arguments that never change the response body.
+IGNORED_ARGS = {'_'}
+
+
+def normalized_args(args):
+    """Sorted (name, values) pairs of the query string, minus ignored args."""
+    return tuple(sorted(
+        (name, tuple(args.getlist(name)))
+        for name in args
+        if name not in IGNORED_ARGS
+    ))
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one computation.
+
+    The first caller of a key runs the function; callers arriving while it
+    runs wait for and share its result (or exception). Nothing is kept once
+    the call finishes, so later calls compute again (or hit a cache).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.coalesced_by = Counter()
+
+    def do(self, key, func, label=None):
+        """Return func() for key, computing it at most once at a time.
+
+        label, when given, is what coalesced calls are counted under.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+                if label is not None:
+                    self.coalesced_by[label] += 1
+        if not leader:
+            return call.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            call.set_exception(e)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'coalesced_by': dict(self.coalesced_by),
+            }
+
+
+class ResponseCache:
+    """Serialized API responses keyed by endpoint, query and dataset version.
+
+    Each entry keeps the body both raw and gzip-compressed, so repeat
+    requests are answered without querying or serializing anything, and
+    unchanged ones with a 304. Streamed responses are sent as they are
+    produced and cached once complete, up to max_stream_bytes. Concurrent
+    misses for the same key run the view once and share its response.
+    """
+
+    def __init__(self, version_func, max_entries=256, max_age=60, compress_level=6, min_compress_size=512,
+                 max_stream_bytes=8 * 1024 * 1024, variant_func=None, bypass_func=None):
+        self.version_func = version_func
+        self.variant_func = variant_func
+        self.bypass_func = bypass_func
+        self.max_stream_bytes = max_stream_bytes
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.compress_level = compress_level
+        self.min_compress_size = min_compress_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.flight = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def key_for(self, endpoint, args, variant=None, version_func=None, view_args=None):
+        return (endpoint, tuple(sorted((view_args or {}).items())), normalized_args(args), variant,
+                (version_func or self.version_func)())
+
+    @staticmethod
+    def etag_for(key):
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:24]
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, mimetype):
+        gzipped = None
+        if len(body) >= self.min_compress_size:
+            gzipped = gzip.compress(body, self.compress_level)
+            if len(gzipped) >= len(body):
+                gzipped = None
+        entry = (body, gzipped, mimetype)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _tee(self, key, chunks, mimetype):
+        """Pass a streamed body through, caching it once fully sent."""
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            if parts is not None:
+                size += len(chunk)
+                if size > self.max_stream_bytes:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            self.put(key, b''.join(parts), mimetype)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _fill(self, key, view, args, kwargs, uncached):
+        """Run the view for a miss and cache its body.
+
+        Responses that cannot be shared (errors, streamed bodies) are
+        appended to uncached instead, for the caller that ran the view.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            uncached.append(response)
+            return None
+        return self.put(key, response.get_data(), response.mimetype)
+
+    def _set_validators(self, response, etag):
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'public, max-age={self.max_age}, must-revalidate'
+        response.vary.add('Accept-Encoding')
+        if self.variant_func is not None:
+            response.vary.add('Accept')
+        return response
+
+    def cached(self, variant_func=None, version_func=None):
+        """Decorator serving a view's 200 responses from the cache.
+
+        variant_func, when given, returns an extra key component for
+        request properties other than the query string (e.g. Accept); it
+        defaults to the cache-wide variant_func. version_func replaces the
+        cache-wide version_func for views that depend on more data. Requests
+        for which bypass_func returns true always run the view.
+        """
+        variant_func = variant_func or self.variant_func
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if self.bypass_func is not None and self.bypass_func():
+                    return view(*args, **kwargs)
+                variant = variant_func() if variant_func else None
+                key = self.key_for(request.endpoint, request.args, variant, version_func, request.view_args)
+                etag = self.etag_for(key)
+                accepts_gzip = request.accept_encodings['gzip'] > 0
+                gzip_etag = f'{etag}-gz'
+
+                for candidate in (etag, gzip_etag):
+                    if request.if_none_match.contains(candidate):
+                        self.not_modified += 1
+                        return self._set_validators(make_response('', 304), candidate)
+
+                entry = self.get(key)
+                if entry is None:
+                    self.misses += 1
+                    uncached = []
+                    entry = self.flight.do(
+                        key, lambda: self._fill(key, view, args, kwargs, uncached), label=request.endpoint)
+                    if uncached:
+                        response = uncached[0]
+                        if response.status_code != 200:
+                            return response
+                        response.response = self._tee(key, response.response, response.mimetype)
+                        return self._set_validators(response, etag)
+                    if entry is None:
+                        # The call this request joined had nothing to share.
+                        return view(*args, **kwargs)
+                else:
+                    self.hits += 1
+
+                body, gzipped, mimetype = entry
+                if accepts_gzip and gzipped is not None:
+                    response = make_response(gzipped)
+                    response.headers['Content-Encoding'] = 'gzip'
+                    etag = gzip_etag
+                else:
+                    response = make_response(body)
+                response.mimetype = mimetype
+                return self._set_validators(response, etag)
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            entries = len(self._entries)
+            size = sum(len(b) + len(g or b'') for b, g, _ in self._entries.values())
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'coalesced': self.flight.coalesced,
+        }
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values.
+
+    The caller passes each value's size in bytes when storing it; the least
+    recently used entries are evicted until the total fits max_bytes.
+    get_or_compute runs compute once for concurrent misses of one key.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=1024):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.flight = SingleFlight()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute, sizeof, label=None):
+        value = self.get(key)
+        if value is None:
+            value = self.flight.do(key, lambda: self._compute(key, compute, sizeof), label=label)
+        return value
+
+    def _compute(self, key, compute, sizeof):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return entry[0]
+        value = compute()
+        self.put(key, value, sizeof(value))
+        return value
+
+    def invalidate(self, predicate=None):
+        """Drop every entry, or only those whose key matches predicate."""
+        with self._lock:
+            for key in list(self._entries):
+                if predicate is None or predicate(key):
+                    self.size -= self._entries.pop(key)[1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'coalesced': self.flight.coalesced,
+            }
@@ -0,0 +1,163 @@
+import numpy as np
+
+# Minimum Dice similarity of character trigrams for a fuzzy match.
+FUZZY_THRESHOLD = 0.7
+
+# Alternative spellings seen in Games data, by NOC. Only aliases of NOCs
+# present in the country profiles are used.
+ALIASES = {
+    'GBR': ['United Kingdom', 'Britain', 'UK'],
+    'USA': ['United States of America', 'United States', 'America'],
+    'URS': ['USSR', 'Soviet Union'],
+    'FRG': ['Federal Republic of Germany'],
+    'GDR': ['German Democratic Republic'],
+    'KOR': ['South Korea', 'Korea'],
+    'PRK': ['North Korea'],
+    'CHN': ['China'],
+    'TPE': ['Taiwan'],
+    'NED': ['Holland', 'The Netherlands'],
+    'RUS': ['Russia'],
+    'TCH': ['Czechoslovakia'],
+    'YUG': ['Yugoslavia'],
+}
+
+RESOLUTION_COLUMNS = ['name', 'noc', 'country', 'method', 'score']
+
+
+def normalize_names(names):
+    """Comparable keys for a sequence of names: accents, case, punctuation,
+    '&' and a leading 'the' do not matter."""
+    import pandas as pd
+
+    keys = (pd.Series(names, dtype=object).astype(str)
+            .str.normalize('NFKD').str.encode('ascii', 'ignore').str.decode('ascii')
+            .str.casefold()
+            .str.replace('&', ' and ', regex=False)
+            .str.replace(r'[^a-z0-9]+', ' ', regex=True)
+            .str.strip()
+            .str.replace(r'^the ', '', regex=True))
+    return keys.to_numpy(dtype=object)
+
+
+def _trigrams(key):
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CountryResolver:
+    """Resolves country names, NOC codes and aliases to (NOC, country) pairs.
+
+    Built once from the country profiles. Names, codes and aliases are
+    looked up by normalized key; the rest are matched against a sparse
+    character-trigram index, so a batch of unknown names costs one sparse
+    product however many countries there are. Results are memoized per
+    name, and known (e.g. read back from the database) seeds that memo.
+    """
+
+    def __init__(self, profiles, aliases=ALIASES, threshold=FUZZY_THRESHOLD, known=None):
+        profiles = list(profiles)
+        self.threshold = threshold
+        self.targets = []
+        noc_target = {}
+        for noc, country in profiles:
+            index = noc_target.get(noc)
+            if index is None:
+                noc_target[noc] = len(self.targets)
+                self.targets.append((noc, country))
+            elif self.targets[index][1] == noc:
+                # Prefer a real name over an entry that repeats the code.
+                self.targets[index] = (noc, country)
+
+        entries = [(noc, target, 'exact') for noc, target in noc_target.items()]
+        entries += [(country, noc_target[noc], 'exact') for noc, country in profiles]
+        entries += [
+            (alias, noc_target[noc], 'alias')
+            for noc, names in aliases.items() if noc in noc_target
+            for alias in names
+        ]
+        self._keys = {}
+        for key, (_, target, method) in zip(normalize_names([e[0] for e in entries]), entries):
+            self._keys.setdefault(key, (target, method))
+        self._build_index([(key, target) for key, (target, method) in self._keys.items() if len(key) > 3])
+        self._resolved = dict(known or {})
+
+    def _build_index(self, keys):
+        from scipy import sparse
+
+        self._vocabulary = {}
+        rows, columns = [], []
+        for row, (key, _) in enumerate(keys):
+            for gram in _trigrams(key):
+                rows.append(row)
+                columns.append(self._vocabulary.setdefault(gram, len(self._vocabulary)))
+        self._index = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+            shape=(len(keys), max(len(self._vocabulary), 1)),
+        )
+        self._index_targets = np.array([target for _, target in keys], dtype=np.int64)
+        self._index_sizes = np.asarray(self._index.sum(axis=1)).ravel()
+
+    def _fuzzy(self, keys):
+        """Best (target, score) per key by trigram Dice similarity, or (-1, 0)."""
+        from scipy import sparse
+
+        best = np.full(len(keys), -1, dtype=np.int64)
+        scores = np.zeros(len(keys))
+        if not len(keys) or not len(self._index_targets):
+            return best, scores
+
+        rows, columns, sizes = [], [], np.zeros(len(keys))
+        for row, key in enumerate(keys):
+            grams = _trigrams(key)
+            sizes[row] = len(grams)
+            for gram in grams:
+                column = self._vocabulary.get(gram)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+        queries = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+            shape=(len(keys), self._index.shape[1]),
+        )
+        shared = (queries @ self._index.T).tocoo()
+        dice = 2 * shared.data / (sizes[shared.row] + self._index_sizes[shared.col])
+
+        order = np.lexsort((-dice, shared.row))
+        query_rows, first = np.unique(shared.row[order], return_index=True)
+        top = order[first]
+        accepted = dice[top] >= self.threshold
+        best[query_rows[accepted]] = self._index_targets[shared.col[top[accepted]]]
+        scores[query_rows[accepted]] = dice[top[accepted]]
+        return best, scores
+
+    def resolve(self, names):
+        """Resolve a column of names at once.
+
+        Returns a DataFrame aligned with names, with columns RESOLUTION_COLUMNS;
+        noc, country and method are None for names that did not resolve.
+        """
+        import pandas as pd
+
+        names = pd.Series(names, dtype=object).reset_index(drop=True)
+        pending = [name for name in pd.unique(names.dropna()) if name not in self._resolved]
+        if pending:
+            keys = normalize_names(pending)
+            found = [self._keys.get(key) for key in keys]
+            found = [None if hit is None else (*hit, 1.0) for hit in found]
+            missing = [i for i, hit in enumerate(found) if hit is None]
+            targets, scores = self._fuzzy([keys[i] for i in missing])
+            for i, target, score in zip(missing, targets, scores):
+                if target >= 0:
+                    found[i] = (target, 'fuzzy', round(float(score), 3))
+            for name, hit in zip(pending, found):
+                if hit is None:
+                    self._resolved[name] = (None, None, None, None)
+                else:
+                    target, method, score = hit
+                    self._resolved[name] = (*self.targets[target], method, score)
+
+        empty = (None, None, None, None)
+        return pd.DataFrame(
+            [(name, *self._resolved.get(name, empty)) for name in names],
+            columns=RESOLUTION_COLUMNS,
+        )
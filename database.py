@@ -0,0 +1,795 @@
+import sqlite3
+import os
+import csv
+import io
+import logging
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from observability import count_rows, stage
+
+log = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+DATA_DIR = os.environ.get('OLYMPIC_DATA_DIR', '.')
+DB_PATH = os.environ.get('OLYMPIC_DB_PATH', os.path.join(DATA_DIR, 'olympic_data.db'))
+
+COUNTRY_PROFILES_CSV = os.path.join(DATA_DIR, 'Olympic_Country_Profiles.csv')
+GAMES_SUMMARY_CSV = os.path.join(DATA_DIR, 'Olympic_Games_Summary.csv')
+MEDAL_TALLY_CSV = os.path.join(DATA_DIR, 'Olympic_Medal_Tally_History.csv')
+
+SOURCE_CSVS = [COUNTRY_PROFILES_CSV, GAMES_SUMMARY_CSV, MEDAL_TALLY_CSV]
+
+# Bump whenever the tables written by init_db change shape, so existing
+# databases get rebuilt even if the CSVs did not change.
+SCHEMA_VERSION = 5
+
+SCHEMA = '''
+CREATE TABLE country_profiles (
+    NOC TEXT NOT NULL,
+    Country TEXT NOT NULL,
+    PRIMARY KEY (NOC, Country)
+) WITHOUT ROWID;
+CREATE UNIQUE INDEX idx_country_profiles_country ON country_profiles (Country, NOC);
+
+CREATE TABLE games_summary (
+    Games_ID INTEGER PRIMARY KEY,
+    edition TEXT NOT NULL,
+    edition_url TEXT,
+    Year INTEGER NOT NULL,
+    Host_city TEXT,
+    country_flag_url TEXT,
+    Host_country TEXT,
+    Host_noc TEXT,
+    start_date TEXT,
+    end_date TEXT,
+    competition_date TEXT,
+    isHeld TEXT,
+    Season TEXT NOT NULL
+);
+CREATE INDEX idx_games_year ON games_summary (Year, Host_city, Host_country, Season);
+CREATE INDEX idx_games_season_year ON games_summary (Season, Year, Host_city, Host_country);
+
+CREATE TABLE medal_tally (
+    Games_ID INTEGER NOT NULL REFERENCES games_summary (Games_ID),
+    NOC TEXT NOT NULL,
+    edition TEXT,
+    year INTEGER NOT NULL,
+    country TEXT,
+    Gold INTEGER NOT NULL,
+    Silver INTEGER NOT NULL,
+    Bronze INTEGER NOT NULL,
+    Total INTEGER NOT NULL,
+    PRIMARY KEY (Games_ID, NOC)
+) WITHOUT ROWID;
+CREATE INDEX idx_medal_tally_noc ON medal_tally (NOC, Games_ID, Gold, Silver, Bronze, Total);
+CREATE INDEX idx_medal_tally_games_total ON medal_tally (Games_ID, Total DESC, NOC, Gold, Silver, Bronze);
+
+CREATE TABLE country_resolution (
+    name TEXT PRIMARY KEY,
+    NOC TEXT,
+    Country TEXT,
+    method TEXT,
+    score REAL
+) WITHOUT ROWID;
+'''
+
+# CSV column names renamed to the database's on insert.
+GAMES_SUMMARY_COLUMNS = {
+    'edition_id': 'Games_ID',
+    'year': 'Year',
+    'city': 'Host_city',
+    'country_noc': 'Host_country'
+}
+MEDAL_TALLY_COLUMNS = {
+    'edition_id': 'Games_ID',
+    'country_noc': 'NOC',
+    'gold': 'Gold',
+    'silver': 'Silver',
+    'bronze': 'Bronze',
+    'total': 'Total'
+}
+
+# Olympiad years covered by each host's performance series.
+HOST_PERFORMANCE_YEARS = range(1896, 2036, 4)
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(paths=None, previous=None):
+    """Return {name: {size, mtime_ns, sha256}} for the source CSVs.
+
+    When a previous fingerprint is given and a file's size and mtime are
+    unchanged, its stored hash is reused instead of re-reading the file.
+    """
+    previous = previous or {}
+    fingerprint = {}
+    for path in paths or SOURCE_CSVS:
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        old = previous.get(name)
+        if old and old.get('size') == entry['size'] and old.get('mtime_ns') == entry['mtime_ns']:
+            entry['sha256'] = old['sha256']
+        else:
+            entry['sha256'] = _file_sha256(path)
+        fingerprint[name] = entry
+    return fingerprint
+
+
+def dataset_version_for(fingerprint):
+    """Short, stable identifier of the data content and schema version."""
+    digest = hashlib.sha256(str(SCHEMA_VERSION).encode())
+    for name in sorted(fingerprint):
+        digest.update(name.encode())
+        digest.update(fingerprint[name]['sha256'].encode())
+    return digest.hexdigest()[:16]
+
+
+def read_db_meta(db_path=DB_PATH):
+    """Read the build metadata stored in the database, or None if missing."""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        rows = conn.execute('SELECT key, value FROM dataset_meta').fetchall()
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    meta = dict(rows)
+    try:
+        return {
+            'schema_version': int(meta['schema_version']),
+            'dataset_version': meta['dataset_version'],
+            'fingerprint': json.loads(meta['fingerprint']),
+        }
+    except (KeyError, ValueError):
+        return None
+
+
+def _write_db_meta(conn, fingerprint):
+    conn.execute('DROP TABLE IF EXISTS dataset_meta')
+    conn.execute('CREATE TABLE dataset_meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    conn.executemany('INSERT INTO dataset_meta (key, value) VALUES (?, ?)', [
+        ('schema_version', str(SCHEMA_VERSION)),
+        ('dataset_version', dataset_version_for(fingerprint)),
+        ('fingerprint', json.dumps(fingerprint, sort_keys=True)),
+    ])
+    conn.commit()
+
+
+def _is_fresh(meta, fingerprint):
+    if not meta or meta['schema_version'] != SCHEMA_VERSION:
+        return False
+    stored = meta['fingerprint']
+    if set(stored) != set(fingerprint):
+        return False
+    return all(stored[name]['sha256'] == fingerprint[name]['sha256'] for name in fingerprint)
+
+
+def _insert_frame(conn, table, frame):
+    """Insert the DataFrame columns that exist in table, as plain Python values."""
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    columns = [c for c in columns if c in frame.columns]
+    values = frame[columns].astype(object).where(frame[columns].notna(), None).values.tolist()
+    conn.executemany(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+        values,
+    )
+    conn.commit()
+
+
+def country_resolver(conn):
+    """CountryResolver over the country_profiles table, seeded with the
+    resolutions already stored in country_resolution."""
+    from countries import CountryResolver
+
+    known = {
+        name: (noc, country, method, score)
+        for name, noc, country, method, score in conn.execute(
+            'SELECT name, NOC, Country, method, score FROM country_resolution')
+    }
+    return CountryResolver(conn.execute('SELECT NOC, Country FROM country_profiles'), known=known)
+
+
+def resolve_host_countries(games, resolver):
+    """Set games' Host_noc and rewrite Host_country to its country_profiles
+    name, resolving each distinct host once. Returns the resolutions."""
+    resolved = resolver.resolve(games['Host_country'])
+    matched = resolved['noc'].notna().to_numpy()
+    hosts = games['Host_country'].to_numpy(dtype=object)
+    countries = resolved['country'].to_numpy(dtype=object)
+
+    fixed_count = int((matched & (countries != hosts)).sum())
+    host_country_issues = sorted({str(host) for host in hosts[~matched]})
+
+    games['Host_noc'] = resolved['noc'].where(resolved['noc'].notna(), None).to_numpy(dtype=object)
+    games['Host_country'] = [country if ok else host for ok, country, host in zip(matched, countries, hosts)]
+
+    if fixed_count > 0:
+        log.info("Fixed %d host country names to match country_profiles entries", fixed_count)
+
+    if host_country_issues:
+        log.warning("Could not find matches for host countries: %s", ', '.join(host_country_issues))
+
+    return resolved
+
+
+def _insert_resolutions(conn, resolutions):
+    """Store name resolutions (unresolved names too) in country_resolution."""
+    resolutions = resolutions.dropna(subset=['name']).drop_duplicates('name')
+    conn.executemany(
+        'INSERT OR REPLACE INTO country_resolution (name, NOC, Country, method, score) VALUES (?, ?, ?, ?, ?)',
+        resolutions.astype(object).where(resolutions.notna(), None).values.tolist(),
+    )
+    conn.commit()
+
+
+def init_db(db_path=DB_PATH, fingerprint=None):
+    """Build the SQLite database from the source CSVs at db_path.
+
+    Raises on failure so callers never publish a half-built database.
+    """
+    conn = sqlite3.connect(db_path)
+
+    try:
+        import pandas as pd
+
+        with stage('csv_load'):
+            country_profiles = pd.read_csv(COUNTRY_PROFILES_CSV)
+            games_summary = pd.read_csv(GAMES_SUMMARY_CSV)
+            medal_tally = pd.read_csv(MEDAL_TALLY_CSV)
+        count_rows('scanned', len(country_profiles) + len(games_summary) + len(medal_tally))
+
+        summer_games = games_summary[games_summary['edition'].str.contains('Summer', na=False)]
+
+        games_summary = games_summary.rename(columns=GAMES_SUMMARY_COLUMNS)
+
+        games_summary['Season'] = games_summary['edition'].apply(
+            lambda x: 'Summer' if 'Summer' in str(x) else 'Winter'
+        )
+
+        summer_games = games_summary[games_summary['Season'] == 'Summer'].copy()
+        summer_games_ids = summer_games['Games_ID'].unique()
+
+        medal_tally = medal_tally.rename(columns=MEDAL_TALLY_COLUMNS)
+
+        summer_medals = medal_tally[medal_tally['Games_ID'].isin(summer_games_ids)]
+
+        country_profiles = country_profiles.rename(columns={
+            'noc': 'NOC',
+            'country': 'Country'
+        })
+
+        from countries import CountryResolver
+
+        resolver = CountryResolver(zip(country_profiles['NOC'], country_profiles['Country']))
+        resolutions = resolve_host_countries(summer_games, resolver)
+
+        conn.executescript(SCHEMA)
+        _insert_frame(conn, 'country_profiles', country_profiles)
+        _insert_frame(conn, 'games_summary', summer_games)
+        _insert_frame(conn, 'medal_tally', summer_medals)
+        _insert_resolutions(conn, resolutions)
+
+        build_host_performance(conn)
+        build_edition_stats(conn)
+
+        _write_db_meta(conn, fingerprint or source_fingerprint())
+
+        conn.execute('ANALYZE')
+        conn.commit()
+
+        cursor = conn.cursor()
+
+        cursor.execute("SELECT COUNT(*) FROM country_profiles")
+        countries_count = cursor.fetchone()[0]
+
+        cursor.execute("SELECT COUNT(*) FROM games_summary")
+        games_count = cursor.fetchone()[0]
+
+        cursor.execute("SELECT COUNT(*) FROM medal_tally")
+        medals_count = cursor.fetchone()[0]
+
+        cursor.execute("""
+            SELECT COUNT(*) FROM games_summary gs
+            JOIN country_profiles cp ON gs.Host_country = cp.Country
+        """)
+        matched_hosts = cursor.fetchone()[0]
+
+        log.info("Database initialized with Summer Olympics data", extra={
+            'countries': countries_count,
+            'games': games_count,
+            'medal_records': medals_count,
+            'matched_hosts': matched_hosts,
+        })
+    finally:
+        conn.close()
+
+
+def csv_line_terminator(path):
+    """The line terminator of the CSV at path, judged by its header line."""
+    with open(path, 'rb') as f:
+        return '\r\n' if f.readline().endswith(b'\r\n') else '\n'
+
+
+def append_csv_rows(path, frame):
+    """Append frame's rows to the CSV at path, in the order of its header
+    and with the file's own line terminator."""
+    import pandas as pd
+
+    header = pd.read_csv(path, nrows=0).columns
+    terminator = csv_line_terminator(path)
+    with open(path, 'rb+') as f:
+        if f.seek(0, os.SEEK_END) > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(terminator.encode())
+    # pandas renders the values; csv writes the lines, since the to_csv
+    # keyword for the line terminator differs between pandas versions.
+    rendered = frame.reindex(columns=header).to_csv(header=False, index=False)
+    with open(path, 'a', newline='') as f:
+        csv.writer(f, lineterminator=terminator).writerows(csv.reader(io.StringIO(rendered)))
+
+
+def replace_csv_rows(path, frame, key):
+    """Append frame's rows to the CSV at path, dropping the rows whose key
+    column holds one of frame's values (e.g. a scheduled edition's row)."""
+    replaced = {str(value) for value in frame[key]}
+    with open(path, newline='') as f:
+        rows = list(csv.reader(f))
+    column = rows[0].index(key)
+    kept = [rows[0]] + [row for row in rows[1:] if row[column] not in replaced]
+    tmp_path = f'{path}.tmp-{os.getpid()}'
+    with open(tmp_path, 'w', newline='') as f:
+        csv.writer(f, lineterminator=csv_line_terminator(path)).writerows(kept)
+    os.replace(tmp_path, path)
+    append_csv_rows(path, frame)
+
+
+def _edition_errors(conn, games, medal_tally, athlete_events):
+    """Problems that keep the rows of a new edition from being appended."""
+    import pandas as pd
+
+    errors = []
+    for label, frame, required in (
+        ('games summary', games, ['edition', *GAMES_SUMMARY_COLUMNS]),
+        ('medal tally', medal_tally, ['edition_id', 'year', *MEDAL_TALLY_COLUMNS]),
+    ):
+        missing = [c for c in required if c not in frame.columns]
+        if missing:
+            errors.append(f"{label} rows lack columns: {', '.join(missing)}")
+    if errors:
+        return errors
+
+    if len(games) != 1:
+        return [f"expected the games summary row of one edition, got {len(games)} rows"]
+    edition = games.iloc[0]
+    if 'Summer' not in str(edition['edition']):
+        errors.append(f"{edition['edition']} is not a Summer edition")
+    games_id, year = int(edition['edition_id']), int(edition['year'])
+    if conn.execute('SELECT 1 FROM games_summary WHERE Year = ? AND Games_ID != ?', (year, games_id)).fetchone():
+        errors.append(f"another edition is already held in {year}")
+    if conn.execute('SELECT 1 FROM medal_tally WHERE Games_ID = ? LIMIT 1', (games_id,)).fetchone():
+        errors.append(f"edition {games_id} already has medal results")
+
+    if len(medal_tally) == 0:
+        errors.append("no medal tally rows")
+    if (medal_tally['edition_id'] != edition['edition_id']).any() or (medal_tally['year'] != edition['year']).any():
+        errors.append(f"medal tally rows must all belong to edition {edition['edition_id']} ({edition['year']})")
+    if medal_tally['country_noc'].isna().any():
+        errors.append("medal tally rows without a country_noc")
+    duplicated = medal_tally['country_noc'][medal_tally['country_noc'].duplicated()]
+    if len(duplicated):
+        errors.append(f"duplicate medal tally rows for {', '.join(sorted(map(str, duplicated.unique())))}")
+    counts = medal_tally[['gold', 'silver', 'bronze', 'total']]
+    if (not all(pd.api.types.is_integer_dtype(counts[c]) for c in counts.columns)
+            or (counts < 0).any().any()):
+        errors.append("medal counts must be non-negative integers")
+    elif (counts['gold'] + counts['silver'] + counts['bronze'] != counts['total']).any():
+        errors.append("total must equal gold + silver + bronze")
+
+    if athlete_events is not None:
+        if 'edition' not in athlete_events.columns:
+            errors.append("athlete event rows lack an edition column")
+        elif (athlete_events['edition'].astype(object) != edition['edition']).any():
+            errors.append(f"athlete event rows must all belong to {edition['edition']}")
+    return errors
+
+
+def append_edition(games_csv, medal_tally_csv, athlete_events_csv=None, db_path=DB_PATH):
+    """Add one new Summer edition without rebuilding the database.
+
+    The arguments hold only the edition's new rows, laid out like
+    Olympic_Games_Summary.csv, Olympic_Medal_Tally_History.csv and
+    Olympic_Athlete_Event_Details.csv; the games row may replace that of a
+    scheduled edition without results. The rows are validated (ValueError
+    lists every problem), inserted into a copy of the database with the
+    host resolved as in init_db, and added to the source CSVs. Only the
+    host_performance rows of the new host and of the NOCs in the tally are
+    rebuilt, edition_stats from the new edition's year on, and the athlete
+    counts gain just the new medals. The copy then replaces db_path with
+    the dataset version of the new CSV fingerprint, so a later rebuild from
+    the CSVs gives the same data.
+    Returns a summary of what was added.
+    """
+    import pandas as pd
+
+    games = pd.read_csv(games_csv)
+    medal_tally = pd.read_csv(medal_tally_csv)
+    athlete_events = None
+    if athlete_events_csv is not None:
+        from athlete_store import read_new_athlete_events
+
+        athlete_events = read_new_athlete_events(athlete_events_csv)
+
+    with _BuildLock(db_path + '.lock'):
+        meta = read_db_meta(db_path)
+        if not meta or meta['schema_version'] != SCHEMA_VERSION:
+            raise ValueError(f"{db_path} is missing or outdated; run init-db first")
+
+        tmp_path = f'{db_path}.tmp-{os.getpid()}'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        source = sqlite3.connect(db_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            source.backup(conn)
+            source.close()
+
+            errors = _edition_errors(conn, games, medal_tally, athlete_events)
+            if errors:
+                raise ValueError('; '.join(errors))
+
+            new_games = games.rename(columns=GAMES_SUMMARY_COLUMNS)
+            _insert_resolutions(conn, resolve_host_countries(new_games, country_resolver(conn)))
+            new_games['Season'] = 'Summer'
+            new_medals = medal_tally.rename(columns=MEDAL_TALLY_COLUMNS)
+            conn.execute('DELETE FROM games_summary WHERE Games_ID = ?', (int(new_games.iloc[0]['Games_ID']),))
+            _insert_frame(conn, 'games_summary', new_games)
+            _insert_frame(conn, 'medal_tally', new_medals)
+
+            nocs = sorted(new_medals['NOC'].astype(str).unique())
+            host_years = {int(new_games.iloc[0]['Year'])}
+            host_years.update(year for (year,) in conn.execute(
+                f"SELECT host_year FROM host_performance WHERE host_noc IN ({','.join('?' * len(nocs))})", nocs))
+            build_host_performance(conn, sorted(host_years))
+            edition_stats_rows = build_edition_stats(conn, int(new_games.iloc[0]['Year']))
+
+            if athlete_events_csv is not None:
+                from athlete_store import append_athlete_events
+
+                append_athlete_events(athlete_events_csv)
+            replace_csv_rows(GAMES_SUMMARY_CSV, games, 'edition_id')
+            append_csv_rows(MEDAL_TALLY_CSV, medal_tally)
+
+            fingerprint = source_fingerprint(previous=meta['fingerprint'])
+            _write_db_meta(conn, fingerprint)
+            conn.execute('ANALYZE')
+            conn.commit()
+            conn.close()
+            os.replace(tmp_path, db_path)
+        except BaseException:
+            source.close()
+            conn.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    summary = {
+        'edition': str(games.iloc[0]['edition']),
+        'games_id': int(games.iloc[0]['edition_id']),
+        'year': int(games.iloc[0]['year']),
+        'host_country': str(new_games.iloc[0]['Host_country']),
+        'medal_rows': len(medal_tally),
+        'athlete_rows': 0 if athlete_events is None else len(athlete_events),
+        'host_performance_rebuilt': len(host_years),
+        'edition_stats_rebuilt': edition_stats_rows,
+        'dataset_version': dataset_version_for(fingerprint),
+    }
+    log.info("Appended edition %s", summary['edition'], extra=summary)
+    return summary
+
+
+def build_host_performance(conn, host_years=None):
+    """Materialise each host's NOC and full medal series into host_performance.
+
+    Every row stores the ready-to-serve JSON object for one host edition, so
+    /api/host-performance is a single indexed read. Pass host_years to
+    (re)build only those hosts.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS host_performance (
+            Games_ID INTEGER PRIMARY KEY,
+            host_year INTEGER NOT NULL,
+            host_country TEXT,
+            host_noc TEXT,
+            payload TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_host_performance_year ON host_performance (host_year)')
+
+    query = '''
+        SELECT gs.Games_ID, gs.Year, gs.Host_country, gs.Host_noc
+        FROM games_summary gs
+    '''
+    params = []
+    if host_years is not None:
+        host_years = list(host_years)
+        query += f" WHERE gs.Year IN ({','.join('?' * len(host_years))})"
+        params = host_years
+    hosts = conn.execute(query, params).fetchall()
+
+    host_nocs = {games_id: noc for games_id, _, _, noc in hosts}
+
+    nocs = sorted({noc for noc in host_nocs.values() if noc})
+    series = {noc: {} for noc in nocs}
+    if nocs:
+        rows = conn.execute(f'''
+            SELECT mt.NOC, gs.Year, mt.Total, mt.Gold, mt.Silver, mt.Bronze
+            FROM medal_tally mt
+            JOIN games_summary gs ON mt.Games_ID = gs.Games_ID
+            WHERE mt.NOC IN ({','.join('?' * len(nocs))})
+            ORDER BY gs.Year
+        ''', nocs).fetchall()
+        for noc, year, total, gold, silver, bronze in rows:
+            series[noc][year] = {'year': year, 'total': total, 'gold': gold, 'silver': silver, 'bronze': bronze}
+
+    records = []
+    for games_id, year, host_country, _ in hosts:
+        noc = host_nocs[games_id]
+        performance = [
+            series.get(noc, {}).get(y, {'year': str(y), 'total': None, 'gold': None, 'silver': None, 'bronze': None})
+            for y in HOST_PERFORMANCE_YEARS
+        ]
+        payload = json.dumps({
+            'host_country': host_country,
+            'host_noc': noc,
+            'host_year': str(year),
+            'performance': performance,
+        }, sort_keys=True)
+        records.append((games_id, year, host_country, noc, payload))
+
+    conn.executemany('INSERT OR REPLACE INTO host_performance VALUES (?, ?, ?, ?, ?)', records)
+    conn.commit()
+    return len(records)
+
+
+def build_edition_stats(conn, from_year=None):
+    """Materialise per-edition ranks, running totals and shares into edition_stats.
+
+    Each medal_tally row gets its rank in its edition by gold first (then
+    silver, bronze) and by total, the NOC's cumulative medals up to and
+    including that edition, and its share of the edition's medals, all
+    computed with window functions in one statement. Pass from_year to
+    (re)build only the editions of that year and later: their running
+    totals start from the sums of the earlier editions, which are unchanged.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS edition_stats (
+            Games_ID INTEGER NOT NULL,
+            year INTEGER NOT NULL,
+            NOC TEXT NOT NULL,
+            gold INTEGER NOT NULL,
+            silver INTEGER NOT NULL,
+            bronze INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            gold_rank INTEGER NOT NULL,
+            total_rank INTEGER NOT NULL,
+            cumulative_gold INTEGER NOT NULL,
+            cumulative_silver INTEGER NOT NULL,
+            cumulative_bronze INTEGER NOT NULL,
+            cumulative_total INTEGER NOT NULL,
+            gold_share REAL,
+            medal_share REAL,
+            PRIMARY KEY (Games_ID, NOC)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_edition_stats_year ON edition_stats (year, gold_rank, NOC)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_edition_stats_noc ON edition_stats (NOC, year)')
+
+    from_year = -1 if from_year is None else int(from_year)
+    conn.execute('DELETE FROM edition_stats WHERE year >= ?', (from_year,))
+    cursor = conn.execute('''
+        INSERT INTO edition_stats
+        WITH editions AS (
+            SELECT mt.Games_ID, gs.Year AS year, mt.NOC, mt.Gold, mt.Silver, mt.Bronze, mt.Total
+            FROM medal_tally mt
+            JOIN games_summary gs ON mt.Games_ID = gs.Games_ID
+            WHERE gs.Year >= :from_year
+        ), earlier AS (
+            SELECT mt.NOC, SUM(mt.Gold) AS gold, SUM(mt.Silver) AS silver,
+                   SUM(mt.Bronze) AS bronze, SUM(mt.Total) AS total
+            FROM medal_tally mt
+            JOIN games_summary gs ON mt.Games_ID = gs.Games_ID
+            WHERE gs.Year < :from_year
+            GROUP BY mt.NOC
+        )
+        SELECT e.Games_ID, e.year, e.NOC, e.Gold, e.Silver, e.Bronze, e.Total,
+               RANK() OVER (PARTITION BY e.Games_ID ORDER BY e.Gold DESC, e.Silver DESC, e.Bronze DESC),
+               RANK() OVER (PARTITION BY e.Games_ID ORDER BY e.Total DESC),
+               COALESCE(b.gold, 0) + SUM(e.Gold) OVER running,
+               COALESCE(b.silver, 0) + SUM(e.Silver) OVER running,
+               COALESCE(b.bronze, 0) + SUM(e.Bronze) OVER running,
+               COALESCE(b.total, 0) + SUM(e.Total) OVER running,
+               CAST(e.Gold AS REAL) / NULLIF(SUM(e.Gold) OVER edition, 0),
+               CAST(e.Total AS REAL) / NULLIF(SUM(e.Total) OVER edition, 0)
+        FROM editions e
+        LEFT JOIN earlier b ON b.NOC = e.NOC
+        WINDOW running AS (PARTITION BY e.NOC ORDER BY e.year, e.Games_ID ROWS UNBOUNDED PRECEDING),
+               edition AS (PARTITION BY e.Games_ID)
+    ''', {'from_year': from_year})
+    conn.commit()
+    return cursor.rowcount
+
+
+def full_table_scans(conn, sql):
+    """Return the EXPLAIN QUERY PLAN steps of sql that scan a table without an index."""
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}').fetchall()
+    return [
+        row[3] for row in plan
+        if row[3].startswith('SCAN ') and ' INDEX ' not in row[3] and 'CONSTANT ROW' not in row[3]
+    ]
+
+
+class _BuildLock:
+    """Advisory inter-process lock so parallel workers build only once."""
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.handle = open(self.path, 'a')
+            fcntl.flock(self.handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.handle is not None:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
+
+
+def ensure_db(db_path=DB_PATH, force=False):
+    """Make sure db_path holds a database built from the current CSVs.
+
+    Opening an up-to-date database costs a stat of each CSV. Rebuilds go to
+    a temporary file that is atomically renamed over db_path, so readers
+    never observe a partially written database.
+    Returns the dataset version of the database in place.
+    """
+    meta = read_db_meta(db_path)
+    fingerprint = source_fingerprint(previous=meta['fingerprint'] if meta else None)
+    if not force and _is_fresh(meta, fingerprint):
+        return meta['dataset_version']
+
+    with _BuildLock(db_path + '.lock'):
+        # Another worker may have finished the rebuild while we waited.
+        meta = read_db_meta(db_path)
+        if not force and _is_fresh(meta, fingerprint):
+            return meta['dataset_version']
+
+        tmp_path = f'{db_path}.tmp-{os.getpid()}'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            init_db(tmp_path, fingerprint)
+            os.replace(tmp_path, db_path)
+        except Exception:
+            log.exception("Error initializing database")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return meta['dataset_version'] if meta else None
+
+    log.info("Rebuilt %s from source CSVs", db_path)
+    return dataset_version_for(fingerprint)
+
+
+class ConnectionPool:
+    """Pool of read-only SQLite connections shared by the request threads.
+
+    Connections are opened with mode=ro&immutable=1 and tuned PRAGMAs, and
+    keep sqlite3's prepared-statement cache warm between requests. When
+    ensure_db() swaps in a rebuilt file, idle connections to the old file
+    are dropped on the next checkout.
+    """
+
+    def __init__(self, db_path=DB_PATH, max_idle=8, cached_statements=128,
+                 mmap_size=256 * 1024 * 1024, cache_size_kib=16 * 1024):
+        self.db_path = db_path
+        self.max_idle = max_idle
+        self.cached_statements = cached_statements
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self._idle = []
+        self._lock = threading.Lock()
+        self._file_id = None
+        self.trace_callback = None
+        self.opened = 0
+        self.checkouts = 0
+
+    def _current_file_id(self):
+        stat = os.stat(self.db_path)
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _open(self):
+        conn = sqlite3.connect(
+            f'file:{self.db_path}?mode=ro&immutable=1',
+            uri=True,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kib)}')
+        conn.execute('PRAGMA query_only = 1')
+        if self.trace_callback is not None:
+            conn.set_trace_callback(self.trace_callback)
+        self.opened += 1
+        return conn
+
+    def _checkout(self):
+        file_id = self._current_file_id()
+        stale = []
+        with self._lock:
+            self.checkouts += 1
+            if file_id != self._file_id:
+                stale, self._idle = self._idle, []
+                self._file_id = file_id
+            conn = self._idle.pop() if self._idle else None
+        for old in stale:
+            old.close()
+        return (conn or self._open()), file_id
+
+    def _return(self, conn, file_id):
+        with self._lock:
+            if file_id == self._file_id and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with block."""
+        conn, file_id = self._checkout()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        else:
+            if conn.in_transaction:
+                conn.rollback()
+            self._return(conn, file_id)
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {'opened': self.opened, 'checkouts': self.checkouts, 'idle': idle}
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+db_pool = ConnectionPool()
@@ -0,0 +1,94 @@
+import json
+
+from flask import request, jsonify
+
+from observability import stage
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+COLUMNAR_MIMETYPE = 'application/vnd.olympic.columnar+json'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+# Formats served and negotiated; MessagePack only with the optional package.
+FORMAT_MIMETYPES = {
+    'json': JSON_MIMETYPE,
+    'columnar': COLUMNAR_MIMETYPE,
+}
+if msgpack is not None:
+    FORMAT_MIMETYPES['msgpack'] = MSGPACK_MIMETYPE
+
+# String columns are dictionary-encoded when they have at most this share
+# of distinct values.
+DICTIONARY_MAX_RATIO = 0.5
+
+
+def negotiate_format(default='json'):
+    """Pick the response format from ?format= or, failing that, the Accept header.
+
+    Returns one of FORMAT_MIMETYPES or any other ?format= value as given, so
+    routes with formats of their own (e.g. ndjson) can handle it.
+    """
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt
+    best = request.accept_mimetypes.best_match(list(FORMAT_MIMETYPES.values()))
+    for name, mimetype in FORMAT_MIMETYPES.items():
+        if best == mimetype:
+            return name
+    return default
+
+
+def to_columnar(rows, columns):
+    """Turn rows (tuples in column order, or dicts) into a columnar table.
+
+    {"columns": [...], "data": {column: [values]}, "dictionaries": {column: [distinct]}}
+    Dictionary-encoded columns hold integer codes into their dictionary.
+    """
+    rows = [tuple(row[c] for c in columns) if isinstance(row, dict) else tuple(row) for row in rows]
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    data = {}
+    dictionaries = {}
+    for name, column in zip(columns, values):
+        column = list(column)
+        if column and all(v is None or isinstance(v, str) for v in column):
+            distinct = list(dict.fromkeys(column))
+            if len(distinct) <= DICTIONARY_MAX_RATIO * len(column):
+                codes = {value: i for i, value in enumerate(distinct)}
+                dictionaries[name] = distinct
+                column = [codes[v] for v in column]
+        data[name] = column
+    return {'columns': list(columns), 'data': data, 'dictionaries': dictionaries}
+
+
+def encoded_response(payload, fmt):
+    """Serialize payload as JSON, columnar JSON or MessagePack."""
+    from flask import current_app
+
+    if fmt == 'msgpack':
+        if msgpack is None:
+            return jsonify({"error": "MessagePack output needs the optional msgpack package"}), 406
+        with stage('serialize'):
+            body = msgpack.packb(payload, use_bin_type=True)
+        return current_app.response_class(body, mimetype=MSGPACK_MIMETYPE)
+    with stage('serialize'):
+        body = json.dumps(payload, separators=(',', ':'))
+    return current_app.response_class(body, mimetype=FORMAT_MIMETYPES.get(fmt, JSON_MIMETYPE))
+
+
+def is_columnar(fmt):
+    return fmt in ('columnar', 'msgpack')
+
+
+def response_formats(*extra):
+    """Formats a route accepts: json, the route's own extra formats, then
+    the columnar ones this server can produce."""
+    return ['json', *extra] + [fmt for fmt in FORMAT_MIMETYPES if is_columnar(fmt)]
+
+
+def unsupported_format(formats):
+    """400 response listing the accepted formats."""
+    return jsonify({"error": f"format must be {', '.join(formats[:-1])} or {formats[-1]}"}), 400
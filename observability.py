@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+log = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    pairs = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        samples = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                samples.append((f'{self.name}_bucket', key + (('le', _number(bound)),), cumulative))
+            samples.append((f'{self.name}_sum', key, total))
+            samples.append((f'{self.name}_count', key, count))
+        return samples
+
+
+class Registry:
+    """Counters and histograms rendered in the Prometheus text format.
+
+    Collectors are callables returning (name, type, help, [(labels, value)])
+    tuples, read at scrape time; they expose gauges such as cache sizes
+    that other objects already keep track of.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            kind = 'histogram' if isinstance(metric, Histogram) else 'counter'
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{_label_text(labels)} {_number(value)}')
+        for collector in self.collectors:
+            try:
+                families = list(collector())
+            except Exception:
+                log.exception("Metrics collector failed")
+                continue
+            for name, kind, help_text, samples in families:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in samples:
+                    lines.append(f'{name}{_label_text(sorted(labels.items()))} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Registry()
+
+REQUEST_SECONDS = metrics.histogram(
+    'olympic_request_duration_seconds', 'Request latency by route, method and status code.')
+RESPONSE_BYTES = metrics.histogram(
+    'olympic_response_bytes', 'Response body size by route.', SIZE_BUCKETS)
+STAGE_SECONDS = metrics.histogram(
+    'olympic_stage_duration_seconds', 'Time spent in named stages of a request, by route and stage.')
+ROWS = metrics.counter(
+    'olympic_rows_total', 'Rows scanned and returned, by route and kind.')
+
+_capture = threading.local()
+
+
+def current_route():
+    """Route template of the current request, or 'background' outside one."""
+    if not has_request_context():
+        return 'background'
+    return request.url_rule.rule if request.url_rule is not None else 'unmatched'
+
+
+@contextmanager
+def stage(name, route=None):
+    """Time the with block as the named stage of the current request.
+
+    Generators producing a streamed body run after the request context is
+    gone, so they pass the route they captured up front.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start, route)
+
+
+def record_stage(name, elapsed, route=None):
+    """Record elapsed seconds spent in the named stage."""
+    captured = getattr(_capture, 'log', None)
+    if captured is not None:
+        captured['stages'].append((name, elapsed))
+    STAGE_SECONDS.observe(elapsed, route=route or current_route(), stage=name)
+    if route is None and has_request_context() and hasattr(g, 'stages'):
+        g.stages[name] = g.stages.get(name, 0.0) + elapsed
+
+
+def count_rows(kind, count, route=None):
+    """Count rows 'scanned' (read to answer the request) or 'returned'."""
+    captured = getattr(_capture, 'log', None)
+    if captured is not None:
+        captured['rows'].append((kind, int(count)))
+    ROWS.inc(int(count), route=route or current_route(), kind=kind)
+    if route is None and has_request_context() and hasattr(g, 'rows'):
+        g.rows[kind] = g.rows.get(kind, 0) + int(count)
+
+
+@contextmanager
+def capture_instrumentation():
+    """Collect the stage timings and row counts recorded in the with block.
+
+    Yields {'stages': [(name, seconds)], 'rows': [(kind, count)]}, filled as
+    the block runs. Compute workers send it back with their result so the
+    requesting process can replay it into its own metrics.
+    """
+    previous = getattr(_capture, 'log', None)
+    _capture.log = {'stages': [], 'rows': []}
+    try:
+        yield _capture.log
+    finally:
+        _capture.log = previous
+
+
+def replay_instrumentation(captured, route=None):
+    """Record stage timings and row counts captured in another process."""
+    for name, elapsed in captured['stages']:
+        record_stage(name, elapsed, route)
+    for kind, count in captured['rows']:
+        count_rows(kind, count, route)
+
+
+def _record_request(route, method, status, started, size, stages, rows):
+    elapsed = time.perf_counter() - started
+    REQUEST_SECONDS.observe(elapsed, route=route, method=method, status=str(status))
+    RESPONSE_BYTES.observe(size, route=route)
+    log.info("request", extra={
+        'route': route,
+        'method': method,
+        'status': status,
+        'duration_ms': round(elapsed * 1000, 2),
+        'bytes': size,
+        'stages_ms': {name: round(seconds * 1000, 2) for name, seconds in stages.items()},
+        'rows': rows,
+    })
+
+
+def _counted(chunks, on_close):
+    size = 0
+    try:
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+    finally:
+        on_close(size)
+
+
+def init_app(app):
+    """Record latency, size, stage timings and row counts of every request."""
+
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+        g.stages = {}
+        g.rows = {}
+
+    @app.after_request
+    def record(response):
+        if not hasattr(g, 'request_started'):
+            return response
+        args = (current_route(), request.method, response.status_code, g.request_started)
+        stages, rows = g.stages, g.rows
+        if response.is_streamed:
+            # Streamed bodies are measured once the last chunk has been sent.
+            response.response = _counted(
+                response.response, lambda size: _record_request(*args, size, stages, rows))
+        else:
+            _record_request(*args, response.calculate_content_length() or 0, stages, rows)
+        return response
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with any extra= fields as top-level keys."""
+
+    _standard = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self._standard and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Log to stderr as JSON lines (OLYMPIC_LOG_FORMAT=text for plain text)."""
+    root = logging.getLogger()
+    if root.handlers:
+        return
+    handler = logging.StreamHandler()
+    if os.environ.get('OLYMPIC_LOG_FORMAT', 'json') == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root.addHandler(handler)
+    root.setLevel(os.environ.get('OLYMPIC_LOG_LEVEL', 'INFO').upper())
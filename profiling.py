@@ -0,0 +1,212 @@
+import os
+import sys
+import hmac
+import time
+import logging
+import pstats
+import cProfile
+import threading
+from collections import Counter, deque
+
+from flask import abort, g, has_request_context, jsonify, request, send_file
+
+from caching import IGNORED_ARGS
+from database import DATA_DIR
+
+log = logging.getLogger(__name__)
+
+# Profiling is only wired up when an admin token is configured.
+ADMIN_TOKEN = os.environ.get('OLYMPIC_ADMIN_TOKEN')
+PROFILE_DIR = os.environ.get('OLYMPIC_PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+PROFILE_KEEP = int(os.environ.get('OLYMPIC_PROFILE_KEEP', '20'))
+SAMPLE_INTERVAL_MS = float(os.environ.get('OLYMPIC_PROFILE_SAMPLE_MS', '1'))
+
+PROFILE_ARG = '_profile'
+PROFILE_HEADER = 'X-Profile'
+TOKEN_HEADER = 'X-Admin-Token'
+
+IGNORED_ARGS.add(PROFILE_ARG)
+
+
+def _authorized():
+    token = request.headers.get(TOKEN_HEADER, '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+
+def profiling_requested():
+    return request.args.get(PROFILE_ARG) == '1' or request.headers.get(PROFILE_HEADER) == '1'
+
+
+def profile_active():
+    """True while the current request is being profiled."""
+    return has_request_context() and 'profiler' in g
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval.
+
+    The counts are written in the collapsed-stack format
+    ("outer;inner;leaf count" per line) read by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class ProfileStore:
+    """The most recent profiles on disk, newest first.
+
+    Holds at most keep entries; the files of older profiles are deleted as
+    new ones arrive.
+    """
+
+    def __init__(self, directory=PROFILE_DIR, keep=PROFILE_KEEP):
+        self.directory = directory
+        self.entries = deque()
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def new_id(self):
+        with self._lock:
+            self._next_id += 1
+            return f'{int(time.time())}-{os.getpid()}-{self._next_id}'
+
+    def add(self, entry):
+        with self._lock:
+            self.entries.appendleft(entry)
+            evicted = [self.entries.pop() for _ in range(max(len(self.entries) - self.keep, 0))]
+        for old in evicted:
+            for path in old['files'].values():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def get(self, profile_id):
+        with self._lock:
+            return next((e for e in self.entries if e['id'] == profile_id), None)
+
+    def listing(self):
+        with self._lock:
+            return [
+                {key: value for key, value in entry.items() if key != 'files'}
+                for entry in self.entries
+            ]
+
+
+profiles = ProfileStore()
+
+
+def _top_functions(stats, limit=15):
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f'{name} ({os.path.basename(filename)}:{line})',
+            'calls': calls,
+            'own_ms': round(own * 1000, 2),
+            'cumulative_ms': round(cumulative * 1000, 2),
+        })
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+def init_app(app):
+    """Profile requests sent with ?_profile=1 (or X-Profile: 1) and a valid
+    X-Admin-Token, and serve the recent profiles under /admin/profiles.
+
+    Does nothing unless OLYMPIC_ADMIN_TOKEN is set, so unprofiled requests
+    pay no cost at all. Profiled requests bypass the response cache and are
+    measured up to the end of the view; a streamed body is not included.
+    """
+    if not ADMIN_TOKEN:
+        return
+
+    @app.before_request
+    def start_profile():
+        if not profiling_requested():
+            return None
+        if not _authorized():
+            abort(403)
+        g.profile_started = time.perf_counter()
+        g.profile_sampler = StackSampler(threading.get_ident(), SAMPLE_INTERVAL_MS / 1000)
+        g.profile_sampler.start()
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+        return None
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        g.profile_sampler.stop()
+        elapsed_ms = round((time.perf_counter() - g.profile_started) * 1000, 2)
+
+        profile_id = profiles.new_id()
+        os.makedirs(profiles.directory, exist_ok=True)
+        files = {
+            'pstats': os.path.join(profiles.directory, f'{profile_id}.pstats'),
+            'collapsed': os.path.join(profiles.directory, f'{profile_id}.collapsed'),
+        }
+        profiler.dump_stats(files['pstats'])
+        g.profile_sampler.write(files['collapsed'])
+
+        profiles.add({
+            'id': profile_id,
+            'route': request.url_rule.rule if request.url_rule is not None else request.path,
+            'url': request.full_path,
+            'status': response.status_code,
+            'started': time.time() - elapsed_ms / 1000,
+            'duration_ms': elapsed_ms,
+            'samples': sum(g.profile_sampler.stacks.values()),
+            'top': _top_functions(pstats.Stats(profiler)),
+            'files': files,
+        })
+        response.headers['X-Profile-Id'] = profile_id
+        log.info("Profiled %s in %s ms as %s", request.full_path, elapsed_ms, profile_id)
+        return response
+
+    @app.route('/admin/profiles')
+    def list_profiles():
+        if not _authorized():
+            abort(403)
+        return jsonify(profiles.listing())
+
+    @app.route('/admin/profiles/<profile_id>/<kind>')
+    def download_profile(profile_id, kind):
+        if not _authorized():
+            abort(403)
+        entry = profiles.get(profile_id)
+        if entry is None or kind not in entry['files']:
+            abort(404)
+        return send_file(entry['files'][kind], mimetype='application/octet-stream', as_attachment=True,
+                         download_name=os.path.basename(entry['files'][kind]))
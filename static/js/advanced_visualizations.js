@@ -73,7 +73,7 @@ function loadHeatmapData() {
     console.log('Loading heatmap data with parameters:', { medalType, yearRange, countryLimit });
     
     // Fetch data from API with proper parameter encoding
-    const url = `/api/sport-country-matrix?medal_type=${encodeURIComponent(medalType)}&year_range=${encodeURIComponent(yearRange)}&country_count=${encodeURIComponent(countryLimit)}`;
+    const url = `/api/sport-country-matrix?medal_type=${encodeURIComponent(medalType)}&year_range=${encodeURIComponent(yearRange)}&country_count=${encodeURIComponent(countryLimit)}&format=columnar`;
     console.log('Fetching from URL:', url);
     
     fetch(url)
@@ -84,6 +84,7 @@ function loadHeatmapData() {
             return response.json();
         })
         .then(data => {
+            data.data = decodeColumnar(data.data);
             console.log('Received heatmap data:', data);
             // Store data globally
             heatmapData = data;
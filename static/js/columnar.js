@@ -0,0 +1,58 @@
+// Helpers for the compact columnar responses served with ?format=columnar.
+// A columnar table looks like
+//   {"columns": [...], "data": {column: [values]}, "dictionaries": {column: [distinct values]}}
+// where dictionary-encoded columns hold indexes into their dictionary.
+
+function decodeColumnar(table) {
+    const columns = table.columns;
+    const dictionaries = table.dictionaries || {};
+    const length = columns.length > 0 ? table.data[columns[0]].length : 0;
+    const decoded = columns.map(column => {
+        const values = table.data[column];
+        const dictionary = dictionaries[column];
+        return dictionary ? values.map(code => dictionary[code]) : values;
+    });
+    
+    const rows = new Array(length);
+    for (let i = 0; i < length; i++) {
+        const row = {};
+        columns.forEach((column, c) => {
+            row[column] = decoded[c][i];
+        });
+        rows[i] = row;
+    }
+    return rows;
+}
+
+// Rebuilds the /api/host-performance rows (with their null-padded
+// per-Olympiad series) from its columnar form.
+function decodeHostPerformance(table) {
+    const hosts = decodeColumnar(table);
+    const byHost = hosts.map(() => new Map());
+    decodeColumnar(table.performance).forEach(p => {
+        byHost[p.host].set(p.year, {year: p.year, total: p.total, gold: p.gold, silver: p.silver, bronze: p.bronze});
+    });
+    return hosts.map((host, i) => ({
+        host_country: host.host_country,
+        host_noc: host.host_noc,
+        host_year: host.host_year,
+        performance: table.years.map(year => byHost[i].get(year) ||
+            {year: String(year), total: null, gold: null, silver: null, bronze: null})
+    }));
+}
+
+function fetchColumnar(url) {
+    const separator = url.includes('?') ? '&' : '?';
+    return fetch(`${url}${separator}format=columnar`).then(response => {
+        if (!response.ok) {
+            throw new Error(`API returned ${response.status}: ${response.statusText}`);
+        }
+        return response.json();
+    });
+}
+
+// Fetches everything a page needs on load from /api/bootstrap/<page> in one
+// request; resolves to the sub-results keyed by their API path.
+function fetchBootstrap(page) {
+    return fetchColumnar(`/api/bootstrap/${page}`).then(body => body.results);
+}
@@ -12,25 +12,10 @@ const medalColors = {
 };
 
 document.addEventListener('DOMContentLoaded', function() {
-    Promise.all([
-        fetch('/api/host-performance').then(response => {
-            if (!response.ok) {
-                throw new Error(`API returned ${response.status}: ${response.statusText}`);
-            }
-            return response.json();
-        }),
-        fetch('/api/countries').then(response => {
-            if (!response.ok) {
-                throw new Error(`API returned ${response.status}: ${response.statusText}`);
-            }
-            return response.json();
-        }),
-        fetch('/api/games').then(response => {
-            if (!response.ok) {
-                throw new Error(`API returned ${response.status}: ${response.statusText}`);
-            }
-            return response.json();
-        })
+    fetchBootstrap('host-city-performance').then(results => [
+        decodeHostPerformance(results['/api/host-performance']),
+        decodeColumnar(results['/api/countries']),
+        decodeColumnar(results['/api/games'])
     ]).then(([hostData, countries, games]) => {
         console.log(`Loaded data: ${hostData.length} hosts, ${countries.length} countries, ${games.length} games`);
         
@@ -14,10 +14,10 @@ const medalColors = {
 const countryColors = d3.schemeCategory10;
 
 document.addEventListener('DOMContentLoaded', function() {
-    Promise.all([
-        fetch('/api/medal-tally').then(response => response.json()),
-        fetch('/api/countries').then(response => response.json()),
-        fetch('/api/games').then(response => response.json())
+    fetchBootstrap('medals-evolution').then(results => [
+        decodeColumnar(results['/api/medal-tally']),
+        decodeColumnar(results['/api/countries']),
+        decodeColumnar(results['/api/games'])
     ]).then(([medals, countries, games]) => {
         medalData = medals;
         countryData = countries;
@@ -0,0 +1,79 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Startup work run on a background thread after the app is importable.
+
+    Tasks run one after another in the order they were added. Required
+    tasks gate readiness; optional ones (cache pre-warming) only report
+    progress. A task raising FileNotFoundError is marked unavailable rather
+    than failed, since the app runs without the optional data files.
+    """
+
+    def __init__(self):
+        self.tasks = OrderedDict()
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def add(self, name, func, required=True):
+        self.tasks[name] = {
+            'func': func,
+            'required': required,
+            'state': 'pending',
+            'elapsed_ms': None,
+            'error': None,
+        }
+
+    def _set(self, name, **fields):
+        with self._lock:
+            self.tasks[name].update(fields)
+
+    def run(self):
+        for name, task in self.tasks.items():
+            self._set(name, state='running')
+            start = time.perf_counter()
+            try:
+                task['func']()
+                state, error = 'done', None
+            except FileNotFoundError as e:
+                state, error = 'unavailable', str(e)
+            except Exception as e:
+                log.exception("Warmup task %s failed", name)
+                state, error = 'failed', f'{type(e).__name__}: {e}'
+            elapsed_ms = round((time.perf_counter() - start) * 1000, 1)
+            self._set(name, state=state, error=error, elapsed_ms=elapsed_ms)
+            log.info("Warmup task %s: %s in %s ms", name, state, elapsed_ms)
+
+    def start(self):
+        """Run the tasks on a daemon thread; returns immediately."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def ready(self):
+        with self._lock:
+            return all(
+                task['state'] in ('done', 'unavailable')
+                for task in self.tasks.values() if task['required']
+            )
+
+    def status(self):
+        with self._lock:
+            tasks = {
+                name: {key: value for key, value in task.items() if key != 'func'}
+                for name, task in self.tasks.items()
+            }
+        finished = sum(task['state'] not in ('pending', 'running') for task in tasks.values())
+        return {
+            'ready': self.ready(),
+            'progress': round(finished / len(tasks), 3) if tasks else 1.0,
+            'uptime_s': round(time.time() - self.started, 1),
+            'tasks': tasks,
+        }
@@ -0,0 +1,168 @@
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from observability import capture_instrumentation, current_route, replay_instrumentation
+
+log = logging.getLogger(__name__)
+
+COMPUTE_WORKERS = int(os.environ.get('OLYMPIC_COMPUTE_WORKERS', max(1, min(4, (os.cpu_count() or 2) - 1))))
+COMPUTE_TIMEOUT = float(os.environ.get('OLYMPIC_COMPUTE_TIMEOUT', '10'))
+COMPUTE_QUEUE = int(os.environ.get('OLYMPIC_COMPUTE_QUEUE', str(4 * max(COMPUTE_WORKERS, 1))))
+
+
+class ComputeUnavailable(Exception):
+    """The compute pool cannot take or finish the job in time."""
+
+    retry_after = 1
+
+
+class ComputeOverloaded(ComputeUnavailable):
+    pass
+
+
+class ComputeTimeout(ComputeUnavailable):
+    retry_after = 5
+
+
+def _preload():
+    """Worker initializer: load the athlete store and SciPy up front."""
+    from athlete_store import get_medal_cube
+
+    try:
+        get_medal_cube()
+    except FileNotFoundError:
+        pass
+    import scipy.cluster.hierarchy  # noqa: F401
+    import scipy.spatial.distance  # noqa: F401
+
+
+def _ping():
+    return os.getpid()
+
+
+def _instrumented(func, args):
+    """Run func(*args) in a worker, returning its stage timings and row counts too.
+
+    Medal counts published since the worker's cube was built (e.g. by
+    `flask append-edition`) are loaded first, so workers never need to be
+    forked again.
+    """
+    from athlete_store import refresh_medal_cube
+
+    refresh_medal_cube()
+    with capture_instrumentation() as captured:
+        result = func(*args)
+    return result, captured
+
+
+class ComputePool:
+    """Bounded process pool for the CPU-heavy analytics.
+
+    Jobs run in worker processes with the medal cube already loaded, so a
+    long clustering run no longer holds the GIL of the request threads. The
+    workers are forked once, by start(), and reload the counts by path when
+    they change. Stage timings and row counts recorded in a worker are
+    replayed into this process's metrics against the route that submitted
+    the job. At most
+    max_pending jobs may be queued or running; further submissions are
+    refused with ComputeOverloaded. A caller waits up to timeout seconds and
+    then gets ComputeTimeout, while the job keeps running and its result is
+    handed to on_late so it can still be cached. With workers=0, before
+    start(), where fork is unavailable, or with inline=True for one job, jobs
+    run on the calling thread.
+    """
+
+    def __init__(self, workers=COMPUTE_WORKERS, max_pending=COMPUTE_QUEUE, timeout=COMPUTE_TIMEOUT):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.late_results = 0
+
+    def start(self):
+        """Fork the workers now.
+
+        Call this before other threads are started: the workers are forked
+        from the calling process and inherit whatever it has loaded. It is
+        never done later, from a thread that may share locks with others.
+        """
+        if self.workers <= 0 or self._executor is not None:
+            return
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            log.warning("fork is not available on this platform; computing analytics inline")
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context('fork'),
+            initializer=_preload,
+        )
+        self._executor.submit(_ping)
+        log.info("Started %d compute workers", self.workers)
+
+    def _release(self, future):
+        with self._lock:
+            self.pending -= 1
+            self.completed += 1
+
+    def run(self, func, *args, on_late=None, inline=False):
+        """Run func(*args) in a worker and return its result.
+
+        inline=True runs it on the calling thread, e.g. so that a profiled
+        request profiles the computation rather than the wait for it.
+        """
+        if self.workers <= 0 or inline or self._executor is None:
+            return func(*args)
+
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise ComputeOverloaded(f"{self.pending} analytics jobs already queued")
+            self.pending += 1
+        future = self._executor.submit(_instrumented, func, args)
+        future.add_done_callback(self._release)
+
+        try:
+            result, captured = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            route = current_route()
+            future.add_done_callback(lambda f: self._deliver_late(f, on_late, route))
+            raise ComputeTimeout(f"{getattr(func, '__name__', func)} did not finish within {self.timeout:g} s")
+        replay_instrumentation(captured)
+        return result
+
+    def _deliver_late(self, future, on_late, route):
+        if future.cancelled() or future.exception() is not None:
+            return
+        result, captured = future.result()
+        replay_instrumentation(captured, route)
+        if on_late is None:
+            return
+        with self._lock:
+            self.late_results += 1
+        on_late(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_pending': self.max_pending,
+                'pending': self.pending,
+                'queue_depth': max(self.pending - self.workers, 0),
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'late_results': self.late_results,
+            }
+
+
+compute_pool = ComputePool()